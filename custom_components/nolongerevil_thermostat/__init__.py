@@ -1,188 +1,758 @@
-from __future__ import annotations
-
-import logging
-from typing import Any
-
-import paho.mqtt.client as mqtt
-from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.typing import ConfigType
-
-from .const import (
-    CONF_DEVICES,
-    CONF_MQTT_BROKER,
-    CONF_MQTT_PASSWORD,
-    CONF_MQTT_PORT,
-    CONF_MQTT_USERNAME,
-    CONF_TOPIC_PREFIX,
-    DEFAULT_MQTT_PORT,
-    DEFAULT_TOPIC_PREFIX,
-    DOMAIN,
-)
-
-_LOGGER = logging.getLogger(__name__)
-
-PLATFORMS: list[Platform] = [Platform.CLIMATE, Platform.FAN, Platform.BINARY_SENSOR]
-
-
-async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
-    hass.data.setdefault(DOMAIN, {})
-    return True
-
-
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    _LOGGER.debug("Setting up No Longer Evil Thermostat integration")
-
-    # Store config entry data
-    hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
-
-    # Set up MQTT connection
-    mqtt_client = NoLongerEvilMQTTClient(hass, entry)
-    await hass.async_add_executor_job(mqtt_client.connect)
-
-    # Store the MQTT client for cleanup later
-    hass.data[DOMAIN][f"{entry.entry_id}_mqtt_client"] = mqtt_client
-
-    # Forward setup to platforms
-    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
-
-    return True
-
-
-async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    _LOGGER.debug("Unloading No Longer Evil Thermostat integration")
-
-    # Unload platforms
-    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
-
-    if unload_ok:
-        # Disconnect MQTT client
-        mqtt_client = hass.data[DOMAIN].get(f"{entry.entry_id}_mqtt_client")
-        if mqtt_client:
-            await hass.async_add_executor_job(mqtt_client.disconnect)
-            hass.data[DOMAIN].pop(f"{entry.entry_id}_mqtt_client")
-
-        hass.data[DOMAIN].pop(entry.entry_id)
-
-    return unload_ok
-
-
-class NoLongerEvilMQTTClient:
-    def __init__(self, hass: HomeAssistant, entry: ConfigEntry) -> None:
-        self.hass = hass
-        self.entry = entry
-        self.client: mqtt.Client | None = None
-        self._callbacks: dict[str, list[callable]] = {}
-
-        # Extract configuration
-        self.broker = entry.data[CONF_MQTT_BROKER]
-        self.port = entry.data.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT)
-        self.username = entry.data.get(CONF_MQTT_USERNAME)
-        self.password = entry.data.get(CONF_MQTT_PASSWORD)
-        self.topic_prefix = entry.data.get(CONF_TOPIC_PREFIX, DEFAULT_TOPIC_PREFIX)
-        self.devices = entry.data.get(CONF_DEVICES, [])
-
-    def connect(self) -> None:
-        client_id = f"ha-nolongerevil-{self.entry.entry_id}"
-        self.client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311)
-
-        if self.username and self.password:
-            self.client.username_pw_set(self.username, self.password)
-
-        self.client.on_connect = self._on_connect
-        self.client.on_message = self._on_message
-        self.client.on_disconnect = self._on_disconnect
-
-        _LOGGER.info("Connecting to MQTT broker: %s:%s", self.broker, self.port)
-        try:
-            self.client.connect(self.broker, self.port, 60)
-            self.client.loop_start()
-        except Exception as err:
-            _LOGGER.error("Failed to connect to MQTT broker: %s", err)
-            raise
-
-    def disconnect(self) -> None:
-        if self.client:
-            _LOGGER.info("Disconnecting from MQTT broker")
-            self.client.loop_stop()
-            self.client.disconnect()
-
-    def _on_connect(
-        self, client: mqtt.Client, userdata: Any, flags: dict, rc: int
-    ) -> None:
-        if rc == 0:
-            _LOGGER.info("Connected to MQTT broker")
-            # Subscribe to all device topics
-            self._subscribe_to_topics()
-        else:
-            _LOGGER.error("Failed to connect to MQTT broker with code: %s", rc)
-
-    def _on_disconnect(self, client: mqtt.Client, userdata: Any, rc: int) -> None:
-        if rc != 0:
-            _LOGGER.warning("Unexpected MQTT disconnection. Reconnecting...")
-
-    def _on_message(
-        self, client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage
-    ) -> None:
-        topic = msg.topic
-        payload = msg.payload.decode("utf-8")
-
-        _LOGGER.debug("Received MQTT message: %s = %s", topic, payload)
-
-        # Call registered callbacks for this topic
-        if topic in self._callbacks:
-            for callback in self._callbacks[topic]:
-                callback(topic, payload)
-
-    def _subscribe_to_topics(self) -> None:
-        if not self.client:
-            return
-
-        for device in self.devices:
-            serial = device.get("serial")
-            if not serial:
-                continue
-
-            topics = [
-                f"{self.topic_prefix}/{serial}/device/current_temperature",
-                f"{self.topic_prefix}/{serial}/shared/target_temperature",
-                f"{self.topic_prefix}/{serial}/shared/target_temperature_low",
-                f"{self.topic_prefix}/{serial}/shared/target_temperature_high",
-                f"{self.topic_prefix}/{serial}/shared/target_temperature_type",
-                f"{self.topic_prefix}/{serial}/device/fan_timer_active",
-                f"{self.topic_prefix}/{serial}/device/away",
-                f"{self.topic_prefix}/{serial}/availability",
-            ]
-
-            for topic in topics:
-                result = self.client.subscribe(topic)
-                if result[0] == mqtt.MQTT_ERR_SUCCESS:
-                    _LOGGER.debug("Subscribed to topic: %s", topic)
-                else:
-                    _LOGGER.error("Failed to subscribe to topic: %s", topic)
-
-    def subscribe(self, topic: str, callback: callable) -> None:
-        if topic not in self._callbacks:
-            self._callbacks[topic] = []
-        self._callbacks[topic].append(callback)
-
-    def publish(self, topic: str, payload: str | int | float | bool) -> None:
-        if not self.client:
-            _LOGGER.error("MQTT client not connected")
-            return
-
-        payload_str = str(payload) if not isinstance(payload, str) else payload
-
-        _LOGGER.debug("Publishing MQTT message: %s = %s", topic, payload_str)
-
-        result = self.client.publish(topic, payload_str, qos=1)
-        if result.rc != mqtt.MQTT_ERR_SUCCESS:
-            _LOGGER.error("Failed to publish to topic %s: %s", topic, result.rc)
-
-    def get_topic(self, serial: str, object_type: str, field: str) -> str:
-        return f"{self.topic_prefix}/{serial}/{object_type}/{field}"
-
-    def get_set_topic(self, serial: str, object_type: str, field: str) -> str:
-        return f"{self.topic_prefix}/{serial}/{object_type}/{field}/set"
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable, Mapping
+import logging
+import threading
+import time
+from typing import Any
+
+import paho.mqtt.client as mqtt
+import voluptuous as vol
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP, Platform
+from homeassistant.core import (
+    CALLBACK_TYPE,
+    Event,
+    HomeAssistant,
+    ServiceCall,
+    callback,
+)
+from homeassistant.exceptions import ConfigEntryNotReady, HomeAssistantError
+from homeassistant.helpers.entity import Entity
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.typing import ConfigType
+
+from .const import (
+    CONF_COMMAND_TTL,
+    CONF_DEVICES,
+    CONF_EXTRA_SENSORS,
+    CONF_MQTT_BROKER,
+    CONF_MQTT_PASSWORD,
+    CONF_MQTT_PORT,
+    CONF_MQTT_USERNAME,
+    CONF_PAYLOAD_ENCODING,
+    CONF_STALE_TIMEOUT,
+    CONF_STATE_TOPIC,
+    CONF_TLS,
+    CONF_TLS_VERIFY,
+    CONF_TOPIC_PREFIX,
+    CONNECTION_KEYS,
+    DEFAULT_COMMAND_TTL,
+    DEFAULT_EXTRA_SENSORS,
+    DEFAULT_MQTT_PORT,
+    DEFAULT_PAYLOAD_ENCODING,
+    DEFAULT_STALE_TIMEOUT,
+    DEFAULT_STATE_TOPIC,
+    DEFAULT_TLS_VERIFY,
+    DEFAULT_TOPIC_PREFIX,
+    DOMAIN,
+    PROBE_TIMEOUT,
+    SERVICE_PROFILE,
+    SERVICE_SET_TRACE,
+    TOPIC_AVAILABILITY,
+    TOPIC_STATE,
+)
+from .aggregates import FleetAggregates
+from .codec import PayloadCodec, decode_text
+from .profiler import PROFILE_COLLAPSED, PROFILE_FORMATS, SamplingProfiler
+from .runtime import RuntimeTracker, async_remove_runtime
+from .spool import CommandSpool, async_remove_spool
+from .timing import SetupTimer
+from .tls import ResumingSSLContext, create_ssl_context
+from .tracing import MessageTracer
+from .watchdog import StaleWatchdog
+
+_LOGGER = logging.getLogger(__name__)
+
+PLATFORMS: list[Platform] = [
+    Platform.CLIMATE,
+    Platform.FAN,
+    Platform.BINARY_SENSOR,
+    Platform.SENSOR,
+]
+
+ATTR_SERIAL = "serial"
+ATTR_SAMPLE_RATE = "sample_rate"
+ATTR_ENABLED = "enabled"
+ATTR_DURATION = "duration"
+ATTR_FORMAT = "format"
+
+SET_TRACE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_SERIAL): cv.string,
+        vol.Optional(ATTR_SAMPLE_RATE, default=1): vol.All(
+            vol.Coerce(int), vol.Range(min=1)
+        ),
+        vol.Optional(ATTR_ENABLED, default=True): cv.boolean,
+    }
+)
+
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_DURATION, default=30): vol.All(
+            vol.Coerce(float), vol.Range(min=1, max=600)
+        ),
+        vol.Optional(ATTR_FORMAT, default=PROFILE_COLLAPSED): vol.In(PROFILE_FORMATS),
+    }
+)
+
+
+async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
+    hass.data.setdefault(DOMAIN, {})
+
+    async def async_set_trace(call: ServiceCall) -> None:
+        serial = call.data.get(ATTR_SERIAL)
+        for mqtt_client in _mqtt_clients(hass):
+            if call.data[ATTR_ENABLED]:
+                mqtt_client.tracer.enable(serial, call.data[ATTR_SAMPLE_RATE])
+            else:
+                mqtt_client.tracer.disable(serial)
+        _LOGGER.info(
+            "Message tracing %s for %s (sample rate 1/%s)",
+            "enabled" if call.data[ATTR_ENABLED] else "disabled",
+            serial or "all devices",
+            call.data[ATTR_SAMPLE_RATE],
+        )
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_TRACE, async_set_trace, schema=SET_TRACE_SCHEMA
+    )
+
+    profiling = asyncio.Lock()
+    # The profile being taken, stopped early if Home Assistant shuts down so
+    # it does not hold an executor thread for up to ten minutes
+    running: list[SamplingProfiler] = []
+
+    async def async_profile(call: ServiceCall) -> None:
+        if profiling.locked():
+            raise HomeAssistantError("A profile is already being taken")
+
+        # Service handlers run on the event loop thread, so this is its ident
+        threads = {threading.get_ident(): "event-loop"}
+        for mqtt_client in _mqtt_clients(hass):
+            if mqtt_client.network_thread_id is not None:
+                threads[mqtt_client.network_thread_id] = (
+                    f"paho-{mqtt_client.entry.entry_id}"
+                )
+
+        output_format = call.data[ATTR_FORMAT]
+        path = hass.config.path(
+            f"{DOMAIN}_profile_{time.strftime('%Y%m%d-%H%M%S')}.{output_format}"
+        )
+        profiler = SamplingProfiler(threads)
+        async with profiling:
+            _LOGGER.info(
+                "Profiling %s threads for %s seconds",
+                len(threads),
+                call.data[ATTR_DURATION],
+            )
+            running.append(profiler)
+            try:
+                await hass.async_add_executor_job(
+                    profiler.run, call.data[ATTR_DURATION]
+                )
+            finally:
+                running.remove(profiler)
+            await hass.async_add_executor_job(profiler.write, path, output_format)
+        _LOGGER.info("Wrote profile to %s", path)
+
+    @callback
+    def async_stop_profile(event: Event) -> None:
+        for profiler in running:
+            profiler.stop()
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_PROFILE, async_profile, schema=PROFILE_SCHEMA
+    )
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_stop_profile)
+    return True
+
+
+def _mqtt_clients(hass: HomeAssistant) -> list[NoLongerEvilMQTTClient]:
+    return [
+        value
+        for value in hass.data.get(DOMAIN, {}).values()
+        if isinstance(value, NoLongerEvilMQTTClient)
+    ]
+
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    _LOGGER.debug("Setting up No Longer Evil Thermostat integration")
+
+    # Time spent in each phase, reported in the diagnostics
+    timer = SetupTimer()
+
+    # Store config entry data
+    hass.data.setdefault(DOMAIN, {})
+    hass.data[DOMAIN][entry.entry_id] = entry.data
+    hass.data[DOMAIN][f"{entry.entry_id}_setup_timer"] = timer
+
+    with timer.phase("client"):
+        mqtt_client = NoLongerEvilMQTTClient(hass, entry)
+    hass.data[DOMAIN][f"{entry.entry_id}_mqtt_client"] = mqtt_client
+
+    # Heating and cooling runtime totals, persisted across restarts
+    runtime = RuntimeTracker(hass, entry.entry_id)
+    hass.data[DOMAIN][f"{entry.entry_id}_runtime"] = runtime
+
+    with timer.phase("storage"):
+        await asyncio.gather(mqtt_client.spool.async_load(), runtime.async_load())
+
+    # Connect to the broker, but leave messages unhandled until the entities
+    # exist, so retained state goes straight to them instead of being dropped
+    with timer.phase("connect"):
+        try:
+            await hass.async_add_executor_job(mqtt_client.connect, False)
+        except OSError as err:
+            # Home Assistant retries the setup until the broker is back; the
+            # spool is kept on disk and flushed on the first connection
+            for key in ("mqtt_client", "runtime", "setup_timer"):
+                hass.data[DOMAIN].pop(f"{entry.entry_id}_{key}", None)
+            hass.data[DOMAIN].pop(entry.entry_id)
+            raise ConfigEntryNotReady(
+                f"Cannot connect to MQTT broker {mqtt_client.broker}:"
+                f"{mqtt_client.port}: {err}"
+            ) from err
+
+    # Fleet and group aggregates fed by the entities as messages arrive
+    with timer.phase("aggregates"):
+        hass.data[DOMAIN][f"{entry.entry_id}_aggregates"] = FleetAggregates(
+            hass, entry.data.get(CONF_DEVICES, [])
+        )
+
+    # Forward setup to platforms
+    with timer.phase("platforms"):
+        await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+
+    with timer.phase("start"):
+        await hass.async_add_executor_job(mqtt_client.start)
+    mqtt_client.watchdog.async_start(mqtt_client.serials)
+    entry.async_on_unload(mqtt_client.watchdog.async_stop)
+    timer.finish()
+    _LOGGER.debug("Set up %s in %.3f s", entry.title, timer.total)
+
+    # Apply broker changes from the options flow without reloading entities
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
+
+    return True
+
+
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    mqtt_client = hass.data[DOMAIN].get(f"{entry.entry_id}_mqtt_client")
+    if not mqtt_client:
+        return
+
+    config = get_entry_config(entry)
+    mqtt_client.watchdog.async_set_timeout(
+        config.get(CONF_STALE_TIMEOUT, DEFAULT_STALE_TIMEOUT)
+    )
+    mqtt_client.command_ttl = config.get(CONF_COMMAND_TTL, DEFAULT_COMMAND_TTL)
+    if not mqtt_client.settings_changed(config):
+        return
+
+    # Field sensors are set up by the sensor platform, so turning them on or
+    # off needs the platforms set up again rather than just a new connection
+    if (
+        config.get(CONF_EXTRA_SENSORS, DEFAULT_EXTRA_SENSORS)
+        != mqtt_client.extra_sensors
+    ):
+        await hass.config_entries.async_reload(entry.entry_id)
+        return
+
+    _LOGGER.info("MQTT settings changed, reconnecting")
+    try:
+        await hass.async_add_executor_job(mqtt_client.reconfigure, config)
+    except (OSError, ValueError) as err:
+        # ValueError and SSLError come from unusable TLS certificates or keys
+        _LOGGER.error("Failed to reconnect with new MQTT settings: %s", err)
+
+
+async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    _LOGGER.debug("Unloading No Longer Evil Thermostat integration")
+
+    # Unload platforms
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+
+    if unload_ok:
+        # Disconnect MQTT client
+        mqtt_client = hass.data[DOMAIN].get(f"{entry.entry_id}_mqtt_client")
+        if mqtt_client:
+            await hass.async_add_executor_job(mqtt_client.disconnect)
+            hass.data[DOMAIN].pop(f"{entry.entry_id}_mqtt_client")
+
+        hass.data[DOMAIN].pop(f"{entry.entry_id}_runtime", None)
+        hass.data[DOMAIN].pop(f"{entry.entry_id}_aggregates", None)
+        hass.data[DOMAIN].pop(f"{entry.entry_id}_setup_timer", None)
+        hass.data[DOMAIN].pop(entry.entry_id)
+
+    return unload_ok
+
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    await async_remove_spool(hass, entry.entry_id)
+    await async_remove_runtime(hass, entry.entry_id)
+
+
+def get_entry_config(entry: ConfigEntry) -> dict[str, Any]:
+    # Options flow values override the broker settings from the initial setup
+    return {**entry.data, **entry.options}
+
+
+# Defaults of connection settings that older entries may not have stored
+_CONNECTION_DEFAULTS = {
+    CONF_MQTT_PORT: DEFAULT_MQTT_PORT,
+    CONF_TOPIC_PREFIX: DEFAULT_TOPIC_PREFIX,
+    CONF_TLS_VERIFY: DEFAULT_TLS_VERIFY,
+    CONF_STATE_TOPIC: DEFAULT_STATE_TOPIC,
+    CONF_PAYLOAD_ENCODING: DEFAULT_PAYLOAD_ENCODING,
+    CONF_EXTRA_SENSORS: DEFAULT_EXTRA_SENSORS,
+}
+
+
+def connection_settings_changed(old: Mapping[str, Any], new: Mapping[str, Any]) -> bool:
+    # The options form stores "" for empty fields and False for switches
+    # where older entries have no key at all, which all mean the same
+    def normalize(config: Mapping[str, Any], key: str) -> Any:
+        return config.get(key, _CONNECTION_DEFAULTS.get(key)) or None
+
+    return any(normalize(old, key) != normalize(new, key) for key in CONNECTION_KEYS)
+
+
+def _create_client(
+    client_id: str,
+    config: Mapping[str, Any],
+    ssl_context: ResumingSSLContext | None = None,
+) -> mqtt.Client:
+    client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311)
+
+    username = config.get(CONF_MQTT_USERNAME)
+    password = config.get(CONF_MQTT_PASSWORD)
+    if username and password:
+        client.username_pw_set(username, password)
+
+    if ssl_context:
+        client.tls_set_context(ssl_context)
+        # Paho checks the hostname itself unless told not to
+        if not ssl_context.check_hostname:
+            client.tls_insecure_set(True)
+
+    return client
+
+
+def probe_broker(
+    config: Mapping[str, Any], timeout: float = PROBE_TIMEOUT
+) -> str | None:
+    # Connect with the given settings and wait for the CONNACK. Returns a
+    # config flow error key, or None when the broker accepted the connection.
+    result: list[int] = []
+    connected = threading.Event()
+
+    def on_connect(client: mqtt.Client, userdata: Any, flags: dict, rc: int) -> None:
+        result.append(rc)
+        connected.set()
+
+    try:
+        ssl_context = create_ssl_context(config) if config.get(CONF_TLS) else None
+    except (OSError, ValueError) as err:
+        _LOGGER.debug("Failed to load TLS certificates: %s", err)
+        return "invalid_certificate"
+
+    client = _create_client(
+        f"ha-nolongerevil-probe-{time.monotonic_ns()}", config, ssl_context
+    )
+    client.on_connect = on_connect
+
+    try:
+        client.connect(
+            config[CONF_MQTT_BROKER],
+            config.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT),
+            60,
+        )
+    except (OSError, ValueError) as err:
+        _LOGGER.debug("MQTT broker probe failed: %s", err)
+        return "cannot_connect"
+
+    client.loop_start()
+    try:
+        if not connected.wait(timeout):
+            return "timeout_connect"
+    finally:
+        client.disconnect()
+        client.loop_stop()
+
+    if result[0] in (
+        mqtt.CONNACK_REFUSED_BAD_USERNAME_PASSWORD,
+        mqtt.CONNACK_REFUSED_NOT_AUTHORIZED,
+    ):
+        return "invalid_auth"
+    if result[0] != mqtt.CONNACK_ACCEPTED:
+        _LOGGER.debug("MQTT broker probe refused with code: %s", result[0])
+        return "cannot_connect"
+    return None
+
+
+class NoLongerEvilMQTTClient:
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry) -> None:
+        self.hass = hass
+        self.entry = entry
+        self.client: mqtt.Client | None = None
+        self.ssl_context: ResumingSSLContext | None = None
+        self._callbacks: dict[str, list[callable]] = {}
+        self._availability_callbacks: dict[str, list[callable]] = {}
+        self._offline: set[str] = set()
+        self._batch: set[Entity] | None = None
+        self._field_listener: Callable[[str, Any], None] | None = None
+        self.tracer = MessageTracer()
+        self.network_thread_id: int | None = None
+        self.spool = CommandSpool(hass, entry.entry_id)
+
+        # Extract configuration
+        config = get_entry_config(entry)
+        self._apply_config(config)
+        # Applies to commands spooled from now on, changeable without a reconnect
+        self.command_ttl = config.get(CONF_COMMAND_TTL, DEFAULT_COMMAND_TTL)
+        self.devices = entry.data.get(CONF_DEVICES, [])
+        self.serials = [
+            device["serial"] for device in self.devices if device.get("serial")
+        ]
+
+        # Devices that go silent are marked unavailable by a shared watchdog
+        self.watchdog = StaleWatchdog(
+            hass,
+            config.get(CONF_STALE_TIMEOUT, DEFAULT_STALE_TIMEOUT),
+            self._notify_availability,
+        )
+        for serial in self.serials:
+            self.subscribe(
+                f"{self.topic_prefix}/{serial}/{TOPIC_AVAILABILITY}",
+                self._handle_availability,
+            )
+            self.subscribe(
+                f"{self.topic_prefix}/{serial}/{TOPIC_STATE}", self._handle_state
+            )
+
+    def _apply_config(self, config: Mapping[str, Any]) -> None:
+        self.broker = config[CONF_MQTT_BROKER]
+        self.port = config.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT)
+        self.username = config.get(CONF_MQTT_USERNAME)
+        self.password = config.get(CONF_MQTT_PASSWORD)
+        self.topic_prefix = config.get(CONF_TOPIC_PREFIX, DEFAULT_TOPIC_PREFIX)
+        self.state_topic = config.get(CONF_STATE_TOPIC, DEFAULT_STATE_TOPIC)
+        self.extra_sensors = config.get(CONF_EXTRA_SENSORS, DEFAULT_EXTRA_SENSORS)
+        self.codec = PayloadCodec(
+            config.get(CONF_PAYLOAD_ENCODING, DEFAULT_PAYLOAD_ENCODING)
+        )
+        self._config = dict(config)
+
+    def settings_changed(self, config: Mapping[str, Any]) -> bool:
+        return connection_settings_changed(self._config, config)
+
+    def reconfigure(self, config: Mapping[str, Any]) -> None:
+        # Swap the broker connection in place. Entity callbacks stay
+        # registered, only re-keyed if the topic prefix changed.
+        old_prefix = self.topic_prefix
+        old_client = self.client
+        self.disconnect()
+        self._apply_config(config)
+
+        if self.topic_prefix != old_prefix:
+            self._callbacks = {
+                self.topic_prefix + topic[len(old_prefix) :]: callbacks
+                for topic, callbacks in self._callbacks.items()
+            }
+
+        try:
+            self.connect()
+        except OSError:
+            # Broker unreachable for now. Keep retrying in the background as
+            # after a dropped connection, rather than staying disconnected
+            # until the entry is reloaded. Commands are spooled meanwhile.
+            # Not if the new client could not even be created (TLS files).
+            if self.client is not old_client:
+                self.client.connect_async(self.broker, self.port, 60)
+                self.client.loop_start()
+            raise
+
+    def connect(self, start: bool = True) -> None:
+        client_id = f"ha-nolongerevil-{self.entry.entry_id}"
+        # Paho reconnects reuse this context and with it the TLS session
+        self.ssl_context = (
+            create_ssl_context(self._config) if self._config.get(CONF_TLS) else None
+        )
+        self.client = _create_client(client_id, self._config, self.ssl_context)
+
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.on_disconnect = self._on_disconnect
+
+        _LOGGER.info("Connecting to MQTT broker: %s:%s", self.broker, self.port)
+        try:
+            self.client.connect(self.broker, self.port, 60)
+        except Exception as err:
+            _LOGGER.error("Failed to connect to MQTT broker: %s", err)
+            raise
+        if start:
+            self.start()
+
+    def start(self) -> None:
+        # The CONNACK, subscriptions and all messages are handled on paho's
+        # network thread, so nothing arrives before this is called
+        self.client.loop_start()
+
+    def disconnect(self) -> None:
+        if self.client:
+            _LOGGER.info("Disconnecting from MQTT broker")
+            self.client.loop_stop()
+            self.client.disconnect()
+
+    def _on_connect(
+        self, client: mqtt.Client, userdata: Any, flags: dict, rc: int
+    ) -> None:
+        if rc == 0:
+            _LOGGER.info("Connected to MQTT broker")
+            # Remembered so the profile service can sample the paho thread
+            self.network_thread_id = threading.get_ident()
+            if self.ssl_context:
+                self.ssl_context.remember_session(client.socket())
+            # Subscribe to all device topics
+            self._subscribe_to_topics()
+            self._flush_spool()
+        else:
+            _LOGGER.error("Failed to connect to MQTT broker with code: %s", rc)
+
+    def _on_disconnect(self, client: mqtt.Client, userdata: Any, rc: int) -> None:
+        if rc != 0:
+            _LOGGER.warning("Unexpected MQTT disconnection. Reconnecting...")
+
+    def _on_message(
+        self, client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage
+    ) -> None:
+        topic = msg.topic
+        try:
+            # Decoded once here so handlers receive ready values. Availability
+            # is plain text whatever encoding the fields use.
+            if topic.endswith(f"/{TOPIC_AVAILABILITY}"):
+                payload = decode_text(msg.payload)
+            else:
+                payload = self.codec.decode(msg.payload)
+        except ValueError as err:
+            _LOGGER.error("Failed to decode payload on %s: %s", topic, err)
+            return
+
+        if self.watchdog.timeout:
+            self.watchdog.seen(self._serial_from_topic(topic))
+
+        # Tracing is off for nearly every message, keep this to a single check
+        tracer = self.tracer
+        sampled = tracer.active and tracer.begin(self._serial_from_topic(topic))
+        start = 0.0
+        if sampled:
+            start = time.perf_counter()
+            tracer.log("Received MQTT message: %s = %s", topic, payload)
+
+        # Call registered callbacks for this topic. The trace is ended even if
+        # a handler raises, or the next message would still be seen as sampled.
+        try:
+            if topic in self._callbacks:
+                for handler in self._callbacks[topic]:
+                    handler(topic, payload)
+            elif self._field_listener:
+                self._field_listener(topic, payload)
+        finally:
+            if sampled:
+                tracer.log(
+                    "Handled %s in %.3f ms",
+                    topic,
+                    (time.perf_counter() - start) * 1000,
+                )
+                tracer.end()
+
+    def _serial_from_topic(self, topic: str) -> str:
+        return topic[len(self.topic_prefix) + 1 :].split("/", 1)[0]
+
+    def _handle_availability(self, topic: str, payload: str) -> None:
+        serial = self._serial_from_topic(topic)
+        online = str(payload).strip().lower() in ("online", "true", "1")
+        if online == (serial not in self._offline):
+            return
+
+        if online:
+            self._offline.discard(serial)
+        else:
+            self._offline.add(serial)
+        self._notify_availability(serial, online)
+
+    def _handle_state(self, topic: str, document: Any) -> None:
+        if not isinstance(document, dict):
+            _LOGGER.error("Ignoring state document on %s: not an object", topic)
+            return
+
+        # Feed every field through the same callbacks as its own topic, but
+        # write each affected entity once for the whole document
+        base = topic[: -len(TOPIC_STATE)]
+        self._batch = batch = set()
+        try:
+            for object_type, fields in document.items():
+                if not isinstance(fields, dict):
+                    continue
+                for field, value in fields.items():
+                    field_topic = f"{base}{object_type}/{field}"
+                    if field_topic in self._callbacks:
+                        for field_callback in self._callbacks[field_topic]:
+                            field_callback(field_topic, value)
+                    elif self._field_listener:
+                        self._field_listener(field_topic, value)
+        finally:
+            self._batch = None
+
+        if batch:
+            self.hass.loop.call_soon_threadsafe(self._async_write_states, batch)
+
+    def schedule_update(self, entity: Entity) -> None:
+        # Called by entity handlers on the paho thread instead of
+        # schedule_update_ha_state, so state documents are written in one go
+        if self._batch is not None:
+            self._batch.add(entity)
+        else:
+            entity.schedule_update_ha_state()
+
+    @callback
+    def _async_write_states(self, entities: set[Entity]) -> None:
+        for entity in entities:
+            entity.async_write_ha_state()
+
+    def _notify_availability(self, serial: str, available: bool) -> None:
+        for availability_callback in self._availability_callbacks.get(serial, []):
+            availability_callback()
+
+    def is_available(self, serial: str) -> bool:
+        return serial not in self._offline and not self.watchdog.is_stale(serial)
+
+    @callback
+    def add_availability_listener(
+        self, serial: str, availability_callback: callable
+    ) -> CALLBACK_TYPE:
+        callbacks = self._availability_callbacks.setdefault(serial, [])
+        callbacks.append(availability_callback)
+
+        def remove_listener() -> None:
+            callbacks.remove(availability_callback)
+
+        return remove_listener
+
+    def _subscribe_to_topics(self) -> None:
+        if not self.client:
+            return
+
+        for device in self.devices:
+            serial = device.get("serial")
+            if not serial:
+                continue
+
+            if self.state_topic:
+                topics = [
+                    f"{self.topic_prefix}/{serial}/{TOPIC_STATE}",
+                    f"{self.topic_prefix}/{serial}/availability",
+                ]
+            elif self.extra_sensors:
+                # Every field, so unmapped ones can get sensors of their own
+                topics = [
+                    f"{self.topic_prefix}/{serial}/+/+",
+                    f"{self.topic_prefix}/{serial}/availability",
+                ]
+            else:
+                topics = self._field_topics(serial)
+
+            for topic in topics:
+                result = self.client.subscribe(topic)
+                if result[0] == mqtt.MQTT_ERR_SUCCESS:
+                    _LOGGER.debug("Subscribed to topic: %s", topic)
+                else:
+                    _LOGGER.error("Failed to subscribe to topic: %s", topic)
+
+    def _field_topics(self, serial: str) -> list[str]:
+        return [
+            f"{self.topic_prefix}/{serial}/device/current_temperature",
+            f"{self.topic_prefix}/{serial}/shared/target_temperature",
+            f"{self.topic_prefix}/{serial}/shared/target_temperature_low",
+            f"{self.topic_prefix}/{serial}/shared/target_temperature_high",
+            f"{self.topic_prefix}/{serial}/shared/target_temperature_type",
+            f"{self.topic_prefix}/{serial}/device/fan_timer_active",
+            f"{self.topic_prefix}/{serial}/device/away",
+            f"{self.topic_prefix}/{serial}/availability",
+        ]
+
+    @callback
+    def set_field_listener(self, listener: Callable[[str, Any], None]) -> CALLBACK_TYPE:
+        # Receives messages for field topics nothing has subscribed to
+        self._field_listener = listener
+
+        def remove_listener() -> None:
+            self._field_listener = None
+
+        return remove_listener
+
+    def subscribe(self, topic: str, handler: callable) -> CALLBACK_TYPE:
+        callbacks = self._callbacks.setdefault(topic, [])
+        callbacks.append(handler)
+
+        def remove_handler() -> None:
+            callbacks.remove(handler)
+
+        return remove_handler
+
+    def publish(
+        self,
+        topic: str,
+        payload: str | int | float | bool,
+    ) -> None:
+        path = topic[len(self.topic_prefix) + 1 :]
+
+        # Keep the command until the broker is back rather than losing it.
+        # Paho would queue it too, but only in memory and with every
+        # intermediate value. The value is spooled unencoded, so it is sent
+        # with whatever encoding is configured by then.
+        if not self.client or not self.client.is_connected():
+            _LOGGER.warning("MQTT client not connected, spooling %s", topic)
+            self.spool.add(path, payload, self.command_ttl)
+            return
+
+        _LOGGER.debug("Publishing MQTT message: %s = %s", topic, payload)
+
+        result = self.client.publish(topic, self.codec.encode(payload), qos=1)
+        if result.rc != mqtt.MQTT_ERR_SUCCESS:
+            _LOGGER.error("Failed to publish to topic %s: %s", topic, result.rc)
+            self.spool.add(path, payload, self.command_ttl)
+            return
+
+        # A newer value supersedes anything still spooled for this field
+        self.spool.discard(path)
+
+    def _flush_spool(self) -> None:
+        pending = self.spool.pop_pending()
+        if not pending:
+            return
+
+        _LOGGER.info("Publishing %s spooled command(s)", len(pending))
+        for path, payload in pending:
+            self.publish(f"{self.topic_prefix}/{path}", payload)
+
+    def diagnostics(self) -> dict[str, Any]:
+        return {
+            "connected": bool(self.client and self.client.is_connected()),
+            "tls": self.ssl_context.as_dict() if self.ssl_context else None,
+            "offline_devices": sorted(self._offline),
+            "stale_devices": self.watchdog.stale_serials,
+            "spooled_commands": len(self.spool),
+            "state_topic": self.state_topic,
+            "payload_encoding": self.codec.encoding,
+            "extra_sensors": self.extra_sensors,
+            "tracing": self.tracer.as_dict(),
+        }
+
+    def get_topic(self, serial: str, object_type: str, field: str) -> str:
+        return f"{self.topic_prefix}/{serial}/{object_type}/{field}"
+
+    def get_set_topic(self, serial: str, object_type: str, field: str) -> str:
+        return f"{self.topic_prefix}/{serial}/{object_type}/{field}/set"
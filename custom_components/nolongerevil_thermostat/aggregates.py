@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+from collections import Counter
+import threading
+from typing import Any
+
+from homeassistant.const import UnitOfTemperature
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.util.unit_conversion import TemperatureConverter
+
+from .const import (
+    CONF_DEVICE_GROUP,
+    CONF_DEVICE_SERIAL,
+    CONF_TEMPERATURE_UNIT,
+    DEFAULT_TEMPERATURE_UNIT,
+)
+
+
+# Running aggregates over a set of thermostats. Every update replaces one
+# device's contribution, so maintaining them costs O(log N) per message
+# instead of a scan over every climate entity.
+class FleetAggregate:
+    def __init__(self, name: str | None) -> None:
+        self.name = name
+        self._temperatures: dict[str, float] = {}
+        self._sorted_temperatures: list[float] = []
+        self._temperature_sum = 0.0
+        self._actions: dict[str, str] = {}
+        self._action_counts: Counter[str] = Counter()
+        self._away: set[str] = set()
+        self._listeners: list[CALLBACK_TYPE] = []
+
+    @property
+    def average_temperature(self) -> float | None:
+        if not self._temperatures:
+            return None
+        return round(self._temperature_sum / len(self._temperatures), 2)
+
+    @property
+    def min_temperature(self) -> float | None:
+        return self._sorted_temperatures[0] if self._sorted_temperatures else None
+
+    @property
+    def max_temperature(self) -> float | None:
+        return self._sorted_temperatures[-1] if self._sorted_temperatures else None
+
+    def action_count(self, action: str) -> int:
+        return self._action_counts[action]
+
+    @property
+    def away_count(self) -> int:
+        return len(self._away)
+
+    def set_temperature(self, serial: str, value: float) -> bool:
+        old = self._temperatures.get(serial)
+        if old == value:
+            return False
+
+        if old is not None:
+            del self._sorted_temperatures[bisect_left(self._sorted_temperatures, old)]
+            self._temperature_sum -= old
+        insort(self._sorted_temperatures, value)
+        self._temperature_sum += value
+        self._temperatures[serial] = value
+        return True
+
+    def set_action(self, serial: str, action: str) -> bool:
+        old = self._actions.get(serial)
+        if old == action:
+            return False
+
+        if old is not None:
+            self._action_counts[old] -= 1
+        self._action_counts[action] += 1
+        self._actions[serial] = action
+        return True
+
+    def set_away(self, serial: str, away: bool) -> bool:
+        if away == (serial in self._away):
+            return False
+
+        if away:
+            self._away.add(serial)
+        else:
+            self._away.discard(serial)
+        return True
+
+    def remove(self, serial: str) -> bool:
+        changed = False
+        if (temperature := self._temperatures.pop(serial, None)) is not None:
+            del self._sorted_temperatures[
+                bisect_left(self._sorted_temperatures, temperature)
+            ]
+            self._temperature_sum -= temperature
+            changed = True
+        if (action := self._actions.pop(serial, None)) is not None:
+            self._action_counts[action] -= 1
+            changed = True
+        if serial in self._away:
+            self._away.discard(serial)
+            changed = True
+        return changed
+
+    @callback
+    def add_listener(self, listener: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        self._listeners.append(listener)
+
+        def remove_listener() -> None:
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+    @callback
+    def async_notify(self) -> None:
+        for listener in self._listeners:
+            listener()
+
+
+# Aggregates for a config entry and for each user-defined device group. Entity
+# handlers feed it from the paho thread; listeners are notified at most once
+# per event loop iteration however many messages arrived in between.
+class FleetAggregates:
+    def __init__(self, hass: HomeAssistant, devices: list[dict[str, Any]]) -> None:
+        self.hass = hass
+        self.entry = FleetAggregate(None)
+        self.groups: dict[str, FleetAggregate] = {}
+        self._by_serial: dict[str, tuple[FleetAggregate, ...]] = {}
+        self._device_units: dict[str, UnitOfTemperature] = {}
+        self._lock = threading.Lock()
+        self._dirty: set[FleetAggregate] = set()
+
+        units = Counter(
+            device.get(CONF_TEMPERATURE_UNIT, DEFAULT_TEMPERATURE_UNIT).lower()
+            for device in devices
+        )
+        self.temperature_unit = (
+            UnitOfTemperature.FAHRENHEIT
+            if units["fahrenheit"] > units["celsius"]
+            else UnitOfTemperature.CELSIUS
+        )
+
+        for device in devices:
+            serial = device[CONF_DEVICE_SERIAL]
+            aggregates = [self.entry]
+            if group := device.get(CONF_DEVICE_GROUP):
+                aggregates.append(self.groups.setdefault(group, FleetAggregate(group)))
+            self._by_serial[serial] = tuple(aggregates)
+
+            # Only devices reporting in another unit need converting
+            unit = (
+                UnitOfTemperature.FAHRENHEIT
+                if device.get(CONF_TEMPERATURE_UNIT, DEFAULT_TEMPERATURE_UNIT).lower()
+                == "fahrenheit"
+                else UnitOfTemperature.CELSIUS
+            )
+            if unit != self.temperature_unit:
+                self._device_units[serial] = unit
+
+    def update_temperature(self, serial: str, value: float) -> None:
+        if unit := self._device_units.get(serial):
+            value = TemperatureConverter.convert(value, unit, self.temperature_unit)
+        self._update(serial, FleetAggregate.set_temperature, value)
+
+    def update_action(self, serial: str, action: str) -> None:
+        self._update(serial, FleetAggregate.set_action, action)
+
+    def update_away(self, serial: str, away: bool) -> None:
+        self._update(serial, FleetAggregate.set_away, away)
+
+    def remove(self, serial: str) -> None:
+        # Drops an unavailable device until its entities feed it again
+        self._update(
+            serial, lambda aggregate, serial, _: aggregate.remove(serial), None
+        )
+
+    def _update(self, serial: str, setter: Any, value: Any) -> None:
+        with self._lock:
+            changed = [
+                aggregate
+                for aggregate in self._by_serial.get(serial, ())
+                if setter(aggregate, serial, value)
+            ]
+            if not changed:
+                return
+            schedule = not self._dirty
+            self._dirty.update(changed)
+
+        if schedule:
+            self.hass.loop.call_soon_threadsafe(self._async_notify)
+
+    @callback
+    def _async_notify(self) -> None:
+        with self._lock:
+            dirty = self._dirty
+            self._dirty = set()
+        for aggregate in dirty:
+            aggregate.async_notify()
@@ -1,113 +1,134 @@
-from __future__ import annotations
-
-import json
-import logging
-from typing import Any
-
-from homeassistant.components.binary_sensor import (
-    BinarySensorDeviceClass,
-    BinarySensorEntity,
-)
-from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.entity_platform import AddEntitiesCallback
-
-from .const import (
-    CONF_DEVICE_NAME,
-    CONF_DEVICE_SERIAL,
-    CONF_DEVICES,
-    DOMAIN,
-    MANUFACTURER,
-    MODEL,
-)
-
-_LOGGER = logging.getLogger(__name__)
-
-
-async def async_setup_entry(
-    hass: HomeAssistant,
-    entry: ConfigEntry,
-    async_add_entities: AddEntitiesCallback,
-) -> None:
-    mqtt_client = hass.data[DOMAIN][f"{entry.entry_id}_mqtt_client"]
-    devices = entry.data.get(CONF_DEVICES, [])
-
-    entities = []
-    for device in devices:
-        entities.append(NoLongerEvilOccupancySensor(hass, mqtt_client, device, entry))
-
-    async_add_entities(entities, True)
-
-
-class NoLongerEvilOccupancySensor(BinarySensorEntity):
-    _attr_has_entity_name = True
-    _attr_name = "Occupancy"
-    _attr_device_class = BinarySensorDeviceClass.OCCUPANCY
-
-    def __init__(
-        self,
-        hass: HomeAssistant,
-        mqtt_client: Any,
-        device: dict[str, Any],
-        entry: ConfigEntry,
-    ) -> None:
-        self.hass = hass
-        self._mqtt_client = mqtt_client
-        self._device = device
-        self._entry = entry
-
-        # Device info
-        self._serial = device[CONF_DEVICE_SERIAL]
-        self._device_name = device[CONF_DEVICE_NAME]
-
-        # State - default to occupied (not away)
-        self._is_occupied: bool = True
-
-        # Subscribe to MQTT topic
-        self._subscribe_to_topic()
-
-    def _subscribe_to_topic(self) -> None:
-        topic = self._mqtt_client.get_topic(self._serial, "device", "away")
-        self._mqtt_client.subscribe(topic, self._handle_away_state)
-
-    def _handle_away_state(self, topic: str, payload: str) -> None:
-        try:
-            value = json.loads(payload) if payload.startswith(("{", "[")) else payload
-
-            # Convert to boolean
-            if isinstance(value, bool):
-                is_away = value
-            elif isinstance(value, str):
-                is_away = value.lower() in ("true", "1", "on")
-            else:
-                is_away = bool(value)
-
-            # Invert: away=True means occupancy=False
-            self._is_occupied = not is_away
-
-            self.schedule_update_ha_state()
-            _LOGGER.debug(
-                "Updated occupancy for %s: %s",
-                self._serial,
-                "occupied" if self._is_occupied else "not occupied",
-            )
-        except (ValueError, TypeError) as err:
-            _LOGGER.error("Failed to parse away state: %s", err)
-
-    @property
-    def unique_id(self) -> str:
-        return f"{self._serial}_occupancy"
-
-    @property
-    def device_info(self) -> dict[str, Any]:
-        return {
-            "identifiers": {(DOMAIN, self._serial)},
-            "name": self._device_name,
-            "manufacturer": MANUFACTURER,
-            "model": MODEL,
-            "serial_number": self._serial,
-        }
-
-    @property
-    def is_on(self) -> bool:
-        return self._is_occupied
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from homeassistant.components.binary_sensor import (
+    BinarySensorDeviceClass,
+    BinarySensorEntity,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .const import (
+    CONF_DEVICE_NAME,
+    CONF_DEVICE_SERIAL,
+    CONF_DEVICES,
+    DOMAIN,
+    MANUFACTURER,
+    MODEL,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    mqtt_client = hass.data[DOMAIN][f"{entry.entry_id}_mqtt_client"]
+    devices = entry.data.get(CONF_DEVICES, [])
+
+    entities = []
+    for device in devices:
+        entities.append(NoLongerEvilOccupancySensor(hass, mqtt_client, device, entry))
+
+    async_add_entities(entities)
+
+
+class NoLongerEvilOccupancySensor(BinarySensorEntity):
+    _attr_has_entity_name = True
+    _attr_name = "Occupancy"
+    _attr_device_class = BinarySensorDeviceClass.OCCUPANCY
+    _attr_should_poll = False
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        mqtt_client: Any,
+        device: dict[str, Any],
+        entry: ConfigEntry,
+    ) -> None:
+        self.hass = hass
+        self._mqtt_client = mqtt_client
+        self._device = device
+        self._entry = entry
+
+        # Device info
+        self._serial = device[CONF_DEVICE_SERIAL]
+        self._device_name = device[CONF_DEVICE_NAME]
+
+        # State - default to occupied (not away)
+        self._is_occupied: bool = True
+        self._aggregates = hass.data[DOMAIN][f"{entry.entry_id}_aggregates"]
+
+    def _subscribe_to_topic(self) -> None:
+        topic = self._mqtt_client.get_topic(self._serial, "device", "away")
+        self.async_on_remove(
+            self._mqtt_client.subscribe(topic, self._handle_away_state)
+        )
+
+    def _handle_away_state(self, topic: str, value: Any) -> None:
+        try:
+            # Convert to boolean
+            if isinstance(value, bool):
+                is_away = value
+            elif isinstance(value, str):
+                is_away = value.lower() in ("true", "1", "on")
+            else:
+                is_away = bool(value)
+
+            # Invert: away=True means occupancy=False
+            self._is_occupied = not is_away
+            self._aggregates.update_away(self._serial, is_away)
+
+            self._mqtt_client.schedule_update(self)
+            if self._mqtt_client.tracer.sampled:
+                self._mqtt_client.tracer.log(
+                    "Updated occupancy for %s: %s",
+                    self._serial,
+                    "occupied" if self._is_occupied else "not occupied",
+                )
+        except (ValueError, TypeError) as err:
+            _LOGGER.error("Failed to parse away state: %s", err)
+
+    def _handle_availability(self) -> None:
+        # An unavailable device is dropped from the fleet aggregates, so its
+        # last known away state counts again once it is back
+        if self.available:
+            self._aggregates.update_away(self._serial, not self._is_occupied)
+        else:
+            self._aggregates.remove(self._serial)
+        self.schedule_update_ha_state()
+
+    async def async_added_to_hass(self) -> None:
+        self._subscribe_to_topic()
+        self.async_on_remove(
+            self._mqtt_client.add_availability_listener(
+                self._serial, self._handle_availability
+            )
+        )
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._serial}_occupancy"
+
+    @property
+    def device_info(self) -> dict[str, Any]:
+        return {
+            "identifiers": {(DOMAIN, self._serial)},
+            "name": self._device_name,
+            "manufacturer": MANUFACTURER,
+            "model": MODEL,
+            "serial_number": self._serial,
+        }
+
+    @property
+    def available(self) -> bool:
+        return self._mqtt_client.is_available(self._serial)
+
+    @property
+    def is_on(self) -> bool:
+        return self._is_occupied
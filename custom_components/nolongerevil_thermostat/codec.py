@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from io import BytesIO
+import json
+from typing import Any
+
+import cbor2
+import msgpack
+
+from .const import PAYLOAD_CBOR, PAYLOAD_MSGPACK
+
+
+def decode_text(payload: bytes) -> Any:
+    # Field topics carry plain text values or JSON
+    text = payload.decode("utf-8")
+    return json.loads(text) if text.startswith(("{", "[")) else text
+
+
+def encode_text(value: Any) -> str:
+    return value if isinstance(value, str) else str(value)
+
+
+def _cbor_loads(payload: bytes) -> Any:
+    # cbor2.loads ignores trailing bytes, which would turn plain text such as
+    # "21.5" into a small integer. BytesIO shares the buffer of the bytes.
+    buffer = BytesIO(payload)
+    value = cbor2.CBORDecoder(buffer).decode()
+    if buffer.tell() != len(payload):
+        raise ValueError("Trailing data after CBOR item")
+    return value
+
+
+# Payload encoding of a config entry. Binary payloads are decoded straight from
+# msg.payload. Field and state topics are decoded strictly in the configured
+# encoding: plain text can be valid MessagePack or CBOR too ("F" is the
+# integer 70, "cool" a CBOR string), so it cannot be told apart by its bytes.
+class PayloadCodec:
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        self._loads: Callable[[bytes], Any] | None = None
+        self._dumps: Callable[[Any], bytes] | None = None
+        if encoding == PAYLOAD_MSGPACK:
+            self._loads = msgpack.unpackb
+            self._dumps = msgpack.packb
+        elif encoding == PAYLOAD_CBOR:
+            self._loads = _cbor_loads
+            self._dumps = cbor2.dumps
+
+    def decode(self, payload: bytes) -> Any:
+        if self._loads is None:
+            return decode_text(payload)
+        try:
+            return self._loads(payload)
+        except (cbor2.CBORDecodeError, msgpack.UnpackException) as err:
+            raise ValueError(f"Invalid {self.encoding} payload: {err}") from err
+
+    def encode(self, value: Any) -> str | bytes:
+        if self._dumps is not None:
+            return self._dumps(value)
+        return encode_text(value)
@@ -1,167 +1,259 @@
-from __future__ import annotations
-
-import logging
-from typing import Any
-
-import voluptuous as vol
-
-from homeassistant import config_entries
-from homeassistant.core import callback
-from homeassistant.data_entry_flow import FlowResult
-import homeassistant.helpers.config_validation as cv
-
-from .const import (
-    CONF_DEVICE_NAME,
-    CONF_DEVICE_SERIAL,
-    CONF_DEVICES,
-    CONF_MQTT_BROKER,
-    CONF_MQTT_PASSWORD,
-    CONF_MQTT_PORT,
-    CONF_MQTT_USERNAME,
-    CONF_TEMPERATURE_UNIT,
-    CONF_TOPIC_PREFIX,
-    DEFAULT_MQTT_PORT,
-    DEFAULT_TEMPERATURE_UNIT,
-    DEFAULT_TOPIC_PREFIX,
-    DOMAIN,
-)
-
-_LOGGER = logging.getLogger(__name__)
-
-STEP_USER_DATA_SCHEMA = vol.Schema(
-    {
-        vol.Required(CONF_MQTT_BROKER): cv.string,
-        vol.Optional(CONF_MQTT_PORT, default=DEFAULT_MQTT_PORT): cv.port,
-        vol.Optional(CONF_MQTT_USERNAME): cv.string,
-        vol.Optional(CONF_MQTT_PASSWORD): cv.string,
-        vol.Optional(CONF_TOPIC_PREFIX, default=DEFAULT_TOPIC_PREFIX): cv.string,
-    }
-)
-
-
-class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
-    VERSION = 1
-
-    def __init__(self) -> None:
-        self._data: dict[str, Any] = {}
-        self._devices: list[dict[str, Any]] = []
-
-    async def async_step_user(
-        self, user_input: dict[str, Any] | None = None
-    ) -> FlowResult:
-        errors: dict[str, str] = {}
-
-        if user_input is not None:
-            # Store MQTT broker configuration
-            self._data = user_input
-
-            # Move to device configuration
-            return await self.async_step_device()
-
-        return self.async_show_form(
-            step_id="user",
-            data_schema=STEP_USER_DATA_SCHEMA,
-            errors=errors,
-        )
-
-    async def async_step_device(
-        self, user_input: dict[str, Any] | None = None
-    ) -> FlowResult:
-        errors: dict[str, str] = {}
-
-        if user_input is not None:
-            # Validate device data
-            if not user_input.get(CONF_DEVICE_NAME):
-                errors[CONF_DEVICE_NAME] = "name_required"
-            elif not user_input.get(CONF_DEVICE_SERIAL):
-                errors[CONF_DEVICE_SERIAL] = "serial_required"
-            elif not user_input[CONF_DEVICE_SERIAL].replace("-", "").isalnum():
-                errors[CONF_DEVICE_SERIAL] = "serial_invalid"
-            elif len(user_input[CONF_DEVICE_SERIAL].replace("-", "")) < 8:
-                errors[CONF_DEVICE_SERIAL] = "serial_too_short"
-            else:
-                # Add device to list
-                self._devices.append(
-                    {
-                        CONF_DEVICE_NAME: user_input[CONF_DEVICE_NAME],
-                        CONF_DEVICE_SERIAL: user_input[CONF_DEVICE_SERIAL].upper(),
-                        CONF_TEMPERATURE_UNIT: user_input.get(
-                            CONF_TEMPERATURE_UNIT, DEFAULT_TEMPERATURE_UNIT
-                        ),
-                    }
-                )
-
-                # Check if user wants to add another device
-                if user_input.get("add_another"):
-                    return await self.async_step_device()
-
-                # Create the config entry
-                self._data[CONF_DEVICES] = self._devices
-                return self.async_create_entry(
-                    title=f"No Longer Evil Thermostat ({len(self._devices)} device{'s' if len(self._devices) > 1 else ''})",
-                    data=self._data,
-                )
-
-        # Schema for device configuration
-        device_schema = vol.Schema(
-            {
-                vol.Required(CONF_DEVICE_NAME): cv.string,
-                vol.Required(CONF_DEVICE_SERIAL): cv.string,
-                vol.Optional(
-                    CONF_TEMPERATURE_UNIT, default=DEFAULT_TEMPERATURE_UNIT
-                ): vol.In(["celsius", "fahrenheit"]),
-                vol.Optional("add_another", default=False): cv.boolean,
-            }
-        )
-
-        return self.async_show_form(
-            step_id="device",
-            data_schema=device_schema,
-            errors=errors,
-            description_placeholders={
-                "device_count": str(len(self._devices)),
-            },
-        )
-
-    @staticmethod
-    @callback
-    def async_get_options_flow(
-        config_entry: config_entries.ConfigEntry,
-    ) -> OptionsFlow:
-        return OptionsFlow(config_entry)
-
-
-class OptionsFlow(config_entries.OptionsFlow):
-    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
-        self.config_entry = config_entry
-
-    async def async_step_init(
-        self, user_input: dict[str, Any] | None = None
-    ) -> FlowResult:
-        if user_input is not None:
-            # Update the config entry with new options
-            return self.async_create_entry(title="", data=user_input)
-
-        # Get current configuration
-        current_broker = self.config_entry.data.get(CONF_MQTT_BROKER, "")
-        current_port = self.config_entry.data.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT)
-        current_username = self.config_entry.data.get(CONF_MQTT_USERNAME, "")
-        current_password = self.config_entry.data.get(CONF_MQTT_PASSWORD, "")
-        current_prefix = self.config_entry.data.get(
-            CONF_TOPIC_PREFIX, DEFAULT_TOPIC_PREFIX
-        )
-
-        options_schema = vol.Schema(
-            {
-                vol.Required(CONF_MQTT_BROKER, default=current_broker): cv.string,
-                vol.Optional(CONF_MQTT_PORT, default=current_port): cv.port,
-                vol.Optional(CONF_MQTT_USERNAME, default=current_username): cv.string,
-                vol.Optional(CONF_MQTT_PASSWORD, default=current_password): cv.string,
-                vol.Optional(CONF_TOPIC_PREFIX, default=current_prefix): cv.string,
-            }
-        )
-
-        return self.async_show_form(
-            step_id="init",
-            data_schema=options_schema,
-        )
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant import config_entries
+from homeassistant.core import callback
+from homeassistant.data_entry_flow import FlowResult
+import homeassistant.helpers.config_validation as cv
+
+from . import connection_settings_changed, get_entry_config, probe_broker
+from .const import (
+    CONF_COMMAND_TTL,
+    CONF_DEVICE_GROUP,
+    CONF_DEVICE_NAME,
+    CONF_DEVICE_SERIAL,
+    CONF_DEVICES,
+    CONF_EXTRA_SENSORS,
+    CONF_MQTT_BROKER,
+    CONF_MQTT_PASSWORD,
+    CONF_MQTT_PORT,
+    CONF_MQTT_USERNAME,
+    CONF_PAYLOAD_ENCODING,
+    CONF_STALE_TIMEOUT,
+    CONF_STATE_TOPIC,
+    CONF_TEMPERATURE_UNIT,
+    CONF_TLS,
+    CONF_TLS_CA_CERT,
+    CONF_TLS_CLIENT_CERT,
+    CONF_TLS_CLIENT_KEY,
+    CONF_TLS_VERIFY,
+    CONF_TOPIC_PREFIX,
+    DEFAULT_COMMAND_TTL,
+    DEFAULT_EXTRA_SENSORS,
+    DEFAULT_MQTT_PORT,
+    DEFAULT_PAYLOAD_ENCODING,
+    DEFAULT_STALE_TIMEOUT,
+    DEFAULT_STATE_TOPIC,
+    DEFAULT_TEMPERATURE_UNIT,
+    DEFAULT_TLS_VERIFY,
+    DEFAULT_TOPIC_PREFIX,
+    DOMAIN,
+    PAYLOAD_CBOR,
+    PAYLOAD_MSGPACK,
+    PAYLOAD_TEXT,
+    TLS_VERIFY_FULL,
+    TLS_VERIFY_INSECURE,
+    TLS_VERIFY_NO_HOSTNAME,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+STEP_USER_DATA_SCHEMA = vol.Schema(
+    {
+        vol.Required(CONF_MQTT_BROKER): cv.string,
+        vol.Optional(CONF_MQTT_PORT, default=DEFAULT_MQTT_PORT): cv.port,
+        vol.Optional(CONF_MQTT_USERNAME): cv.string,
+        vol.Optional(CONF_MQTT_PASSWORD): cv.string,
+        vol.Optional(CONF_TOPIC_PREFIX, default=DEFAULT_TOPIC_PREFIX): cv.string,
+        vol.Optional(CONF_TLS, default=False): cv.boolean,
+        vol.Optional(CONF_TLS_VERIFY, default=DEFAULT_TLS_VERIFY): vol.In(
+            [TLS_VERIFY_FULL, TLS_VERIFY_NO_HOSTNAME, TLS_VERIFY_INSECURE]
+        ),
+        vol.Optional(CONF_TLS_CA_CERT): cv.string,
+        vol.Optional(CONF_TLS_CLIENT_CERT): cv.string,
+        vol.Optional(CONF_TLS_CLIENT_KEY): cv.string,
+        vol.Optional(CONF_STATE_TOPIC, default=DEFAULT_STATE_TOPIC): cv.boolean,
+        vol.Optional(CONF_PAYLOAD_ENCODING, default=DEFAULT_PAYLOAD_ENCODING): vol.In(
+            [PAYLOAD_TEXT, PAYLOAD_MSGPACK, PAYLOAD_CBOR]
+        ),
+        vol.Optional(CONF_EXTRA_SENSORS, default=DEFAULT_EXTRA_SENSORS): cv.boolean,
+    }
+)
+
+
+class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
+    VERSION = 1
+
+    def __init__(self) -> None:
+        self._data: dict[str, Any] = {}
+        self._devices: list[dict[str, Any]] = []
+
+    async def async_step_user(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        errors: dict[str, str] = {}
+
+        if user_input is not None:
+            # Make sure the broker is reachable and accepts the credentials
+            error = await self.hass.async_add_executor_job(probe_broker, user_input)
+            if error:
+                errors["base"] = error
+            else:
+                # Store MQTT broker configuration
+                self._data = user_input
+
+                # Move to device configuration
+                return await self.async_step_device()
+
+        return self.async_show_form(
+            step_id="user",
+            data_schema=STEP_USER_DATA_SCHEMA,
+            errors=errors,
+        )
+
+    async def async_step_device(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        errors: dict[str, str] = {}
+
+        if user_input is not None:
+            # Validate device data
+            if not user_input.get(CONF_DEVICE_NAME):
+                errors[CONF_DEVICE_NAME] = "name_required"
+            elif not user_input.get(CONF_DEVICE_SERIAL):
+                errors[CONF_DEVICE_SERIAL] = "serial_required"
+            elif not user_input[CONF_DEVICE_SERIAL].replace("-", "").isalnum():
+                errors[CONF_DEVICE_SERIAL] = "serial_invalid"
+            elif len(user_input[CONF_DEVICE_SERIAL].replace("-", "")) < 8:
+                errors[CONF_DEVICE_SERIAL] = "serial_too_short"
+            else:
+                # Add device to list
+                device = {
+                    CONF_DEVICE_NAME: user_input[CONF_DEVICE_NAME],
+                    CONF_DEVICE_SERIAL: user_input[CONF_DEVICE_SERIAL].upper(),
+                    CONF_TEMPERATURE_UNIT: user_input.get(
+                        CONF_TEMPERATURE_UNIT, DEFAULT_TEMPERATURE_UNIT
+                    ),
+                }
+                if group := user_input.get(CONF_DEVICE_GROUP, "").strip():
+                    device[CONF_DEVICE_GROUP] = group
+                self._devices.append(device)
+
+                # Check if user wants to add another device
+                if user_input.get("add_another"):
+                    return await self.async_step_device()
+
+                # Create the config entry
+                self._data[CONF_DEVICES] = self._devices
+                return self.async_create_entry(
+                    title=f"No Longer Evil Thermostat ({len(self._devices)} device{'s' if len(self._devices) > 1 else ''})",
+                    data=self._data,
+                )
+
+        # Schema for device configuration
+        device_schema = vol.Schema(
+            {
+                vol.Required(CONF_DEVICE_NAME): cv.string,
+                vol.Required(CONF_DEVICE_SERIAL): cv.string,
+                vol.Optional(
+                    CONF_TEMPERATURE_UNIT, default=DEFAULT_TEMPERATURE_UNIT
+                ): vol.In(["celsius", "fahrenheit"]),
+                vol.Optional(CONF_DEVICE_GROUP, default=""): cv.string,
+                vol.Optional("add_another", default=False): cv.boolean,
+            }
+        )
+
+        return self.async_show_form(
+            step_id="device",
+            data_schema=device_schema,
+            errors=errors,
+            description_placeholders={
+                "device_count": str(len(self._devices)),
+            },
+        )
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(
+        config_entry: config_entries.ConfigEntry,
+    ) -> OptionsFlow:
+        return OptionsFlow(config_entry)
+
+
+class OptionsFlow(config_entries.OptionsFlow):
+    def __init__(self, config_entry: config_entries.ConfigEntry) -> None:
+        self.config_entry = config_entry
+
+    async def async_step_init(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        errors: dict[str, str] = {}
+
+        if user_input is not None:
+            # Only a changed connection needs the broker, so options such as
+            # the command TTL can still be saved while it is unreachable
+            error = None
+            if connection_settings_changed(
+                get_entry_config(self.config_entry), user_input
+            ):
+                error = await self.hass.async_add_executor_job(probe_broker, user_input)
+            if error:
+                errors["base"] = error
+            else:
+                # Update the config entry with new options, the update
+                # listener reconnects the running client
+                return self.async_create_entry(title="", data=user_input)
+
+        # Get current configuration
+        config = get_entry_config(self.config_entry)
+        current_broker = config.get(CONF_MQTT_BROKER, "")
+        current_port = config.get(CONF_MQTT_PORT, DEFAULT_MQTT_PORT)
+        current_username = config.get(CONF_MQTT_USERNAME, "")
+        current_password = config.get(CONF_MQTT_PASSWORD, "")
+        current_prefix = config.get(CONF_TOPIC_PREFIX, DEFAULT_TOPIC_PREFIX)
+        current_stale_timeout = config.get(CONF_STALE_TIMEOUT, DEFAULT_STALE_TIMEOUT)
+        current_command_ttl = config.get(CONF_COMMAND_TTL, DEFAULT_COMMAND_TTL)
+        current_tls = config.get(CONF_TLS, False)
+        current_tls_verify = config.get(CONF_TLS_VERIFY, DEFAULT_TLS_VERIFY)
+        current_tls_ca_cert = config.get(CONF_TLS_CA_CERT, "")
+        current_tls_client_cert = config.get(CONF_TLS_CLIENT_CERT, "")
+        current_tls_client_key = config.get(CONF_TLS_CLIENT_KEY, "")
+        current_state_topic = config.get(CONF_STATE_TOPIC, DEFAULT_STATE_TOPIC)
+        current_payload_encoding = config.get(
+            CONF_PAYLOAD_ENCODING, DEFAULT_PAYLOAD_ENCODING
+        )
+        current_extra_sensors = config.get(CONF_EXTRA_SENSORS, DEFAULT_EXTRA_SENSORS)
+
+        options_schema = vol.Schema(
+            {
+                vol.Required(CONF_MQTT_BROKER, default=current_broker): cv.string,
+                vol.Optional(CONF_MQTT_PORT, default=current_port): cv.port,
+                vol.Optional(CONF_MQTT_USERNAME, default=current_username): cv.string,
+                vol.Optional(CONF_MQTT_PASSWORD, default=current_password): cv.string,
+                vol.Optional(CONF_TOPIC_PREFIX, default=current_prefix): cv.string,
+                vol.Optional(CONF_TLS, default=current_tls): cv.boolean,
+                vol.Optional(CONF_TLS_VERIFY, default=current_tls_verify): vol.In(
+                    [TLS_VERIFY_FULL, TLS_VERIFY_NO_HOSTNAME, TLS_VERIFY_INSECURE]
+                ),
+                vol.Optional(CONF_TLS_CA_CERT, default=current_tls_ca_cert): cv.string,
+                vol.Optional(
+                    CONF_TLS_CLIENT_CERT, default=current_tls_client_cert
+                ): cv.string,
+                vol.Optional(
+                    CONF_TLS_CLIENT_KEY, default=current_tls_client_key
+                ): cv.string,
+                vol.Optional(CONF_STATE_TOPIC, default=current_state_topic): cv.boolean,
+                vol.Optional(
+                    CONF_PAYLOAD_ENCODING, default=current_payload_encoding
+                ): vol.In([PAYLOAD_TEXT, PAYLOAD_MSGPACK, PAYLOAD_CBOR]),
+                vol.Optional(
+                    CONF_EXTRA_SENSORS, default=current_extra_sensors
+                ): cv.boolean,
+                vol.Optional(
+                    CONF_STALE_TIMEOUT, default=current_stale_timeout
+                ): vol.All(vol.Coerce(int), vol.Range(min=0)),
+                vol.Optional(CONF_COMMAND_TTL, default=current_command_ttl): vol.All(
+                    vol.Coerce(int), vol.Range(min=1)
+                ),
+            }
+        )
+
+        return self.async_show_form(
+            step_id="init",
+            data_schema=options_schema,
+            errors=errors,
+        )
@@ -1,37 +1,106 @@
-DOMAIN = "nolongerevil_thermostat"
-
-# Configuration keys
-CONF_MQTT_BROKER = "mqtt_broker"
-CONF_MQTT_PORT = "mqtt_port"
-CONF_MQTT_USERNAME = "mqtt_username"
-CONF_MQTT_PASSWORD = "mqtt_password"
-CONF_TOPIC_PREFIX = "topic_prefix"
-CONF_DEVICES = "devices"
-CONF_DEVICE_NAME = "name"
-CONF_DEVICE_SERIAL = "serial"
-CONF_TEMPERATURE_UNIT = "temperature_unit"
-
-# Default values
-DEFAULT_MQTT_PORT = 1883
-DEFAULT_TOPIC_PREFIX = "nest"
-DEFAULT_TEMPERATURE_UNIT = "celsius"
-
-# MQTT Topics (format: {prefix}/{serial}/{object_type}/{field})
-TOPIC_CURRENT_TEMP = "device/current_temperature"
-TOPIC_TARGET_TEMP = "shared/target_temperature"
-TOPIC_TARGET_TEMP_LOW = "shared/target_temperature_low"
-TOPIC_TARGET_TEMP_HIGH = "shared/target_temperature_high"
-TOPIC_TARGET_TEMP_TYPE = "shared/target_temperature_type"
-TOPIC_FAN_TIMER_ACTIVE = "device/fan_timer_active"
-TOPIC_AWAY = "device/away"
-TOPIC_AVAILABILITY = "availability"
-
-# HVAC modes mapping
-NEST_MODE_OFF = "off"
-NEST_MODE_HEAT = "heat"
-NEST_MODE_COOL = "cool"
-NEST_MODE_RANGE = "range"
-
-# Manufacturer info
-MANUFACTURER = "Google Nest"
-MODEL = "Nest Thermostat"
+DOMAIN = "nolongerevil_thermostat"
+
+# Configuration keys
+CONF_MQTT_BROKER = "mqtt_broker"
+CONF_MQTT_PORT = "mqtt_port"
+CONF_MQTT_USERNAME = "mqtt_username"
+CONF_MQTT_PASSWORD = "mqtt_password"
+CONF_TOPIC_PREFIX = "topic_prefix"
+CONF_DEVICES = "devices"
+CONF_DEVICE_NAME = "name"
+CONF_DEVICE_SERIAL = "serial"
+CONF_DEVICE_GROUP = "group"
+CONF_TEMPERATURE_UNIT = "temperature_unit"
+CONF_STALE_TIMEOUT = "stale_timeout"
+CONF_COMMAND_TTL = "command_ttl"
+CONF_TLS = "tls"
+CONF_TLS_CA_CERT = "tls_ca_cert"
+CONF_TLS_CLIENT_CERT = "tls_client_cert"
+CONF_TLS_CLIENT_KEY = "tls_client_key"
+CONF_TLS_VERIFY = "tls_verify"
+CONF_STATE_TOPIC = "state_topic"
+CONF_PAYLOAD_ENCODING = "payload_encoding"
+CONF_EXTRA_SENSORS = "extra_sensors"
+
+# Settings that require reconnecting to the broker when changed
+CONNECTION_KEYS = (
+    CONF_MQTT_BROKER,
+    CONF_MQTT_PORT,
+    CONF_MQTT_USERNAME,
+    CONF_MQTT_PASSWORD,
+    CONF_TOPIC_PREFIX,
+    CONF_TLS,
+    CONF_TLS_CA_CERT,
+    CONF_TLS_CLIENT_CERT,
+    CONF_TLS_CLIENT_KEY,
+    CONF_TLS_VERIFY,
+    CONF_STATE_TOPIC,
+    CONF_PAYLOAD_ENCODING,
+    CONF_EXTRA_SENSORS,
+)
+
+# TLS certificate verification modes
+TLS_VERIFY_FULL = "full"
+TLS_VERIFY_NO_HOSTNAME = "no_hostname"
+TLS_VERIFY_INSECURE = "insecure"
+
+# Payload encodings
+PAYLOAD_TEXT = "text"
+PAYLOAD_MSGPACK = "msgpack"
+PAYLOAD_CBOR = "cbor"
+
+# Default values
+DEFAULT_MQTT_PORT = 1883
+DEFAULT_TOPIC_PREFIX = "nest"
+DEFAULT_TEMPERATURE_UNIT = "celsius"
+DEFAULT_STALE_TIMEOUT = 0  # seconds, 0 disables the stale-data watchdog
+DEFAULT_COMMAND_TTL = 3600  # seconds a spooled command stays valid
+DEFAULT_TLS_VERIFY = "full"
+DEFAULT_PAYLOAD_ENCODING = "text"
+DEFAULT_EXTRA_SENSORS = False
+DEFAULT_STATE_TOPIC = False  # per-field topics unless the firmware sends documents
+
+# Seconds to wait for the broker to acknowledge a connection probe
+PROBE_TIMEOUT = 10
+
+# MQTT Topics (format: {prefix}/{serial}/{object_type}/{field})
+TOPIC_CURRENT_TEMP = "device/current_temperature"
+TOPIC_TARGET_TEMP = "shared/target_temperature"
+TOPIC_TARGET_TEMP_LOW = "shared/target_temperature_low"
+TOPIC_TARGET_TEMP_HIGH = "shared/target_temperature_high"
+TOPIC_TARGET_TEMP_TYPE = "shared/target_temperature_type"
+TOPIC_FAN_TIMER_ACTIVE = "device/fan_timer_active"
+TOPIC_AWAY = "device/away"
+TOPIC_AVAILABILITY = "availability"
+
+# Fields owned by the climate, fan and binary sensor entities. Field discovery
+# skips them, also when those entities are disabled and not subscribed.
+MAPPED_FIELDS = frozenset(
+    {
+        TOPIC_CURRENT_TEMP,
+        TOPIC_TARGET_TEMP,
+        TOPIC_TARGET_TEMP_LOW,
+        TOPIC_TARGET_TEMP_HIGH,
+        TOPIC_TARGET_TEMP_TYPE,
+        TOPIC_FAN_TIMER_ACTIVE,
+        TOPIC_AWAY,
+    }
+)
+
+# Optional aggregated state document (format: {prefix}/{serial}/state), e.g.
+# {"device": {"current_temperature": 21.5}, "shared": {"target_temperature": 21}}
+TOPIC_STATE = "state"
+
+# Services
+SERVICE_SET_TRACE = "set_trace"
+SERVICE_PROFILE = "profile"
+
+# HVAC modes mapping
+NEST_MODE_OFF = "off"
+NEST_MODE_HEAT = "heat"
+NEST_MODE_COOL = "cool"
+NEST_MODE_RANGE = "range"
+
+# Manufacturer info
+MANUFACTURER = "Google Nest"
+MODEL = "Nest Thermostat"
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from . import get_entry_config
+from .const import CONF_MQTT_PASSWORD, CONF_MQTT_USERNAME, DOMAIN
+
+TO_REDACT = {CONF_MQTT_PASSWORD, CONF_MQTT_USERNAME}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    mqtt_client = hass.data[DOMAIN][f"{entry.entry_id}_mqtt_client"]
+    timer = hass.data[DOMAIN][f"{entry.entry_id}_setup_timer"]
+
+    return {
+        "config": async_redact_data(get_entry_config(entry), TO_REDACT),
+        "client": mqtt_client.diagnostics(),
+        "setup": timer.as_dict(),
+    }
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from datetime import datetime
+import logging
+import threading
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+from .const import MAPPED_FIELDS
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds to collect newly seen fields before creating their entities, so the
+# burst of retained fields after connecting is registered in one batch
+DISCOVERY_BATCH_DELAY = 1.0
+# Upper bound of entities per batch. Adding thousands of entities at once
+# keeps the event loop busy for seconds; larger bursts are spread over
+# several batches instead.
+DISCOVERY_BATCH_SIZE = 250
+
+
+# Creates entities the first time an unmapped field shows up on the wildcard
+# stream. Fields are collected from the paho thread and handed to `create` in
+# batches on the event loop; every topic is looked at once, so fields that
+# are ignored or already have an entity cost a set lookup afterwards.
+class FieldDiscovery:
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        mqtt_client: Any,
+        serials: set[str],
+        known: set[str],
+        create: Callable[[list[tuple[str, str, str, Any]]], None],
+    ) -> None:
+        self.hass = hass
+        self._mqtt_client = mqtt_client
+        self._serials = serials
+        self._create = create
+        # Topics that already have a sensor, enabled or not
+        self._seen: set[str] = set(known)
+        self._pending: dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._unsub_flush: CALLBACK_TYPE | None = None
+
+    def handle_field(self, topic: str, value: Any) -> None:
+        # Called from the paho thread for topics nothing has subscribed to
+        if topic in self._seen:
+            return
+
+        levels = self._split(topic)
+        if (
+            len(levels) != 3
+            or levels[0] not in self._serials
+            or f"{levels[1]}/{levels[2]}" in MAPPED_FIELDS
+            or not isinstance(value, (str, int, float))
+        ):
+            self._seen.add(topic)
+            return
+
+        with self._lock:
+            schedule = not self._pending
+            # Latest value wins until the entity exists
+            self._pending[topic] = value
+        if schedule:
+            self.hass.loop.call_soon_threadsafe(self._async_schedule_flush)
+
+    @callback
+    def _async_schedule_flush(self) -> None:
+        if self._unsub_flush is None:
+            self._unsub_flush = async_call_later(
+                self.hass, DISCOVERY_BATCH_DELAY, self._async_flush
+            )
+
+    @callback
+    def _async_flush(self, now: datetime) -> None:
+        self._unsub_flush = None
+        with self._lock:
+            if len(self._pending) <= DISCOVERY_BATCH_SIZE:
+                pending = self._pending
+                self._pending = {}
+            else:
+                pending = {}
+                for topic in list(self._pending)[:DISCOVERY_BATCH_SIZE]:
+                    pending[topic] = self._pending.pop(topic)
+            self._seen.update(pending)
+            more = bool(self._pending)
+
+        fields = [(*self._split(topic), value) for topic, value in pending.items()]
+
+        _LOGGER.debug("Discovered %s new field(s)", len(fields))
+        self._create(fields)
+        if more:
+            self._async_schedule_flush()
+
+    def _split(self, topic: str) -> list[str]:
+        # {prefix}/{serial}/{object_type}/{field}
+        return topic[len(self._mqtt_client.topic_prefix) + 1 :].split("/")
+
+    @callback
+    def async_stop(self) -> None:
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+from collections import Counter
+import marshal
+import os
+import sys
+import threading
+import time
+from types import FrameType
+
+PROFILE_COLLAPSED = "collapsed"
+PROFILE_PSTATS = "pstats"
+PROFILE_FORMATS = (PROFILE_COLLAPSED, PROFILE_PSTATS)
+
+DEFAULT_INTERVAL = 0.005
+
+# (filename, first line, function name), the key pstats uses for a function
+CodeKey = tuple[str, int, str]
+
+
+# Samples the stacks of a fixed set of threads from a separate thread for a
+# bounded time. Nothing is installed in the sampled threads, so they run at
+# full speed, and no thread exists at all while no profile is being taken.
+class SamplingProfiler:
+    def __init__(
+        self, threads: dict[int, str], interval: float = DEFAULT_INTERVAL
+    ) -> None:
+        self.threads = threads
+        self.interval = interval
+        self.samples: Counter[tuple[str, tuple[CodeKey, ...]]] = Counter()
+        # Sampling rounds and the time they took; the wait between rounds
+        # overshoots the interval, so this is the real time per sample
+        self.rounds = 0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+
+    def run(self, duration: float) -> None:
+        # Blocks for `duration` seconds or until stopped, run it in an
+        # executor thread
+        self.samples.clear()
+        self.rounds = 0
+        self._stop.clear()
+        start = time.monotonic()
+        deadline = start + duration
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            self._sample()
+            self.rounds += 1
+        self.elapsed = time.monotonic() - start
+
+    @property
+    def sample_seconds(self) -> float:
+        return self.elapsed / self.rounds if self.rounds else self.interval
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _sample(self) -> None:
+        frames = sys._current_frames()  # pylint: disable=protected-access
+        for ident, name in self.threads.items():
+            frame: FrameType | None = frames.get(ident)
+            stack: list[CodeKey] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.samples[(name, tuple(stack))] += 1
+
+    def write(self, path: str, output_format: str) -> None:
+        if output_format == PROFILE_PSTATS:
+            self.write_pstats(path)
+        else:
+            self.write_collapsed(path)
+
+    def write_collapsed(self, path: str) -> None:
+        # One "thread;outer;...;inner count" line per distinct stack, the
+        # input format of flamegraph.pl, speedscope and friends
+        with open(path, "w", encoding="utf-8") as file:
+            for (name, stack), count in self.samples.most_common():
+                frames = ";".join(_label(key) for key in stack)
+                file.write(f"{name};{frames} {count}\n")
+
+    def write_pstats(self, path: str) -> None:
+        # Sample counts converted to seconds in the layout pstats.Stats loads,
+        # so the file opens in pstats, snakeviz and similar viewers
+        sample_seconds = self.sample_seconds
+        stats: dict[CodeKey, list] = {}
+        for (_name, stack), count in self.samples.items():
+            seconds = count * sample_seconds
+            seen: set[CodeKey] = set()
+            for depth, key in enumerate(stack):
+                entry = stats.setdefault(key, [0, 0, 0.0, 0.0, {}])
+                # Recursive frames only count once towards cumulative time
+                if key not in seen:
+                    seen.add(key)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += seconds
+                if depth:
+                    caller = entry[4].setdefault(stack[depth - 1], [0, 0, 0.0, 0.0])
+                    caller[0] += count
+                    caller[1] += count
+                    caller[3] += seconds
+                if depth == len(stack) - 1:
+                    entry[2] += seconds
+                    if depth:
+                        entry[4][stack[depth - 1]][2] += seconds
+
+        with open(path, "wb") as file:
+            marshal.dump(
+                {
+                    key: (
+                        cc,
+                        nc,
+                        tt,
+                        ct,
+                        {caller: tuple(value) for caller, value in callers.items()},
+                    )
+                    for key, (cc, nc, tt, ct, callers) in stats.items()
+                },
+                file,
+            )
+
+
+def _label(key: CodeKey) -> str:
+    filename, line, name = key
+    parent, base = os.path.split(filename)
+    return f"{name} ({os.path.basename(parent)}/{base}:{line})"
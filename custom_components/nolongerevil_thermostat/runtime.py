@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 30
+
+RUNTIME_HEATING = "heating"
+RUNTIME_COOLING = "cooling"
+
+
+def _storage_key(entry_id: str) -> str:
+    return f"{DOMAIN}.{entry_id}.runtime"
+
+
+# Accumulated heating and cooling seconds per serial. Climate entities add the
+# time spent in their previous action on every HVAC action update, so totals
+# are maintained in O(1) per message and never need a history query.
+class RuntimeTracker:
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self.hass = hass
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, _storage_key(entry_id)
+        )
+        self._totals: dict[str, dict[str, float]] = {}
+        self._listeners: dict[str, list[CALLBACK_TYPE]] = {}
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load()
+        if data:
+            self._totals = data.get("totals", {})
+
+    def get(self, serial: str, action: str) -> float:
+        return self._totals.get(serial, {}).get(action, 0.0)
+
+    def add(self, serial: str, action: str, seconds: float) -> None:
+        # Called from the paho thread
+        totals = self._totals.setdefault(
+            serial, {RUNTIME_HEATING: 0.0, RUNTIME_COOLING: 0.0}
+        )
+        totals[action] = totals.get(action, 0.0) + seconds
+        self.hass.loop.call_soon_threadsafe(self._async_changed, serial)
+
+    @callback
+    def add_listener(self, serial: str, listener: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        listeners = self._listeners.setdefault(serial, [])
+        listeners.append(listener)
+
+        def remove_listener() -> None:
+            listeners.remove(listener)
+
+        return remove_listener
+
+    @callback
+    def _async_changed(self, serial: str) -> None:
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+        for listener in self._listeners.get(serial, []):
+            listener()
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        return {
+            # Snapshot first, the paho thread may add serials meanwhile
+            "totals": {
+                serial: dict(totals) for serial, totals in list(self._totals.items())
+            }
+        }
+
+
+async def async_remove_runtime(hass: HomeAssistant, entry_id: str) -> None:
+    await Store(hass, STORAGE_VERSION, _storage_key(entry_id)).async_remove()
@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable
+from typing import Any
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import (
+    PERCENTAGE,
+    EntityCategory,
+    UnitOfElectricPotential,
+    UnitOfTemperature,
+    UnitOfTime,
+)
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.util import slugify
+
+from .const import (
+    CONF_DEVICE_NAME,
+    CONF_DEVICE_SERIAL,
+    CONF_DEVICES,
+    CONF_TEMPERATURE_UNIT,
+    DEFAULT_TEMPERATURE_UNIT,
+    DOMAIN,
+    MANUFACTURER,
+    MODEL,
+)
+from .aggregates import FleetAggregate, FleetAggregates
+from .discovery import FieldDiscovery
+from .runtime import RUNTIME_COOLING, RUNTIME_HEATING, RuntimeTracker
+
+_LOGGER = logging.getLogger(__name__)
+
+# key: (name, is temperature, value)
+FLEET_SENSORS: dict[str, tuple[str, bool, Callable[[FleetAggregate], Any]]] = {
+    "average_temperature": (
+        "Average temperature",
+        True,
+        lambda aggregate: aggregate.average_temperature,
+    ),
+    "min_temperature": (
+        "Minimum temperature",
+        True,
+        lambda aggregate: aggregate.min_temperature,
+    ),
+    "max_temperature": (
+        "Maximum temperature",
+        True,
+        lambda aggregate: aggregate.max_temperature,
+    ),
+    "heating": (
+        "Heating",
+        False,
+        lambda aggregate: aggregate.action_count("heating"),
+    ),
+    "cooling": (
+        "Cooling",
+        False,
+        lambda aggregate: aggregate.action_count("cooling"),
+    ),
+    "away": ("Away", False, lambda aggregate: aggregate.away_count),
+}
+
+# Known fields published by the firmware, keyed by {object_type}/{field}.
+# Fields handled by the climate, fan and binary sensor entities (MAPPED_FIELDS)
+# never get a sensor; any other field gets a generic diagnostic sensor, disabled by
+# default.
+FIELD_SENSORS: dict[str, SensorEntityDescription] = {
+    description.key: description
+    for description in (
+        SensorEntityDescription(
+            key="device/current_humidity",
+            name="Humidity",
+            device_class=SensorDeviceClass.HUMIDITY,
+            state_class=SensorStateClass.MEASUREMENT,
+            native_unit_of_measurement=PERCENTAGE,
+        ),
+        SensorEntityDescription(
+            key="device/target_humidity",
+            name="Target humidity",
+            device_class=SensorDeviceClass.HUMIDITY,
+            native_unit_of_measurement=PERCENTAGE,
+        ),
+        SensorEntityDescription(
+            key="device/battery_level",
+            name="Battery voltage",
+            device_class=SensorDeviceClass.VOLTAGE,
+            state_class=SensorStateClass.MEASUREMENT,
+            native_unit_of_measurement=UnitOfElectricPotential.VOLT,
+            entity_category=EntityCategory.DIAGNOSTIC,
+        ),
+        SensorEntityDescription(
+            key="device/backplate_temperature",
+            name="Backplate temperature",
+            device_class=SensorDeviceClass.TEMPERATURE,
+            state_class=SensorStateClass.MEASUREMENT,
+            native_unit_of_measurement=UnitOfTemperature.CELSIUS,
+            entity_category=EntityCategory.DIAGNOSTIC,
+        ),
+        SensorEntityDescription(
+            key="shared/hvac_heater_state",
+            name="Heater relay",
+            device_class=SensorDeviceClass.ENUM,
+            options=["on", "off"],
+        ),
+        SensorEntityDescription(
+            key="shared/hvac_ac_state",
+            name="Cooling relay",
+            device_class=SensorDeviceClass.ENUM,
+            options=["on", "off"],
+        ),
+        SensorEntityDescription(
+            key="shared/hvac_fan_state",
+            name="Fan relay",
+            device_class=SensorDeviceClass.ENUM,
+            options=["on", "off"],
+        ),
+        SensorEntityDescription(
+            key="device/leaf",
+            name="Leaf",
+            device_class=SensorDeviceClass.ENUM,
+            options=["on", "off"],
+        ),
+    )
+}
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    runtime = hass.data[DOMAIN][f"{entry.entry_id}_runtime"]
+    devices = entry.data.get(CONF_DEVICES, [])
+
+    entities = []
+    for device in devices:
+        for action in (RUNTIME_HEATING, RUNTIME_COOLING):
+            entities.append(NoLongerEvilRuntimeSensor(runtime, device, action))
+
+    # Fleet sensors for the whole entry and for each device group
+    aggregates = hass.data[DOMAIN][f"{entry.entry_id}_aggregates"]
+    for aggregate in (aggregates.entry, *aggregates.groups.values()):
+        for key in FLEET_SENSORS:
+            entities.append(NoLongerEvilFleetSensor(aggregates, aggregate, entry, key))
+
+    # Sensors for other fields the thermostats publish, created as they are
+    # first seen. Fields seen in earlier runs are in the entity registry and
+    # are set up right away.
+    mqtt_client = hass.data[DOMAIN][f"{entry.entry_id}_mqtt_client"]
+    if mqtt_client.extra_sensors:
+        devices_by_serial = {device[CONF_DEVICE_SERIAL]: device for device in devices}
+        known: set[str] = set()
+        registry = er.async_get(hass)
+        for registry_entry in er.async_entries_for_config_entry(
+            registry, entry.entry_id
+        ):
+            serial, _, path = registry_entry.unique_id.partition("_field_")
+            if not path or serial not in devices_by_serial:
+                continue
+            object_type, field = path.split("/", 1)
+            known.add(mqtt_client.get_topic(serial, object_type, field))
+            # Disabled sensors would never be added, don't build them at all
+            if not registry_entry.disabled:
+                entities.append(
+                    NoLongerEvilFieldSensor(
+                        mqtt_client, devices_by_serial[serial], object_type, field
+                    )
+                )
+
+        @callback
+        def async_create_field_sensors(fields: list[tuple[str, str, str, Any]]) -> None:
+            async_add_entities(
+                NoLongerEvilFieldSensor(
+                    mqtt_client, devices_by_serial[serial], object_type, field, value
+                )
+                for serial, object_type, field, value in fields
+            )
+
+        discovery = FieldDiscovery(
+            hass, mqtt_client, set(devices_by_serial), known, async_create_field_sensors
+        )
+        entry.async_on_unload(mqtt_client.set_field_listener(discovery.handle_field))
+        entry.async_on_unload(discovery.async_stop)
+
+    async_add_entities(entities)
+
+
+class NoLongerEvilRuntimeSensor(SensorEntity):
+    _attr_has_entity_name = True
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+    _attr_native_unit_of_measurement = UnitOfTime.HOURS
+    _attr_suggested_display_precision = 2
+    _attr_should_poll = False
+
+    def __init__(
+        self,
+        runtime: RuntimeTracker,
+        device: dict[str, Any],
+        action: str,
+    ) -> None:
+        self._runtime = runtime
+        self._action = action
+
+        # Device info
+        self._serial = device[CONF_DEVICE_SERIAL]
+        self._device_name = device[CONF_DEVICE_NAME]
+
+        self._attr_name = f"{action.capitalize()} runtime"
+
+    async def async_added_to_hass(self) -> None:
+        self.async_on_remove(
+            self._runtime.add_listener(self._serial, self.async_write_ha_state)
+        )
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._serial}_{self._action}_runtime"
+
+    @property
+    def device_info(self) -> dict[str, Any]:
+        return {
+            "identifiers": {(DOMAIN, self._serial)},
+            "name": self._device_name,
+            "manufacturer": MANUFACTURER,
+            "model": MODEL,
+            "serial_number": self._serial,
+        }
+
+    @property
+    def native_value(self) -> float:
+        return round(self._runtime.get(self._serial, self._action) / 3600, 4)
+
+
+class NoLongerEvilFleetSensor(SensorEntity):
+    _attr_has_entity_name = True
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_should_poll = False
+
+    def __init__(
+        self,
+        aggregates: FleetAggregates,
+        aggregate: FleetAggregate,
+        entry: ConfigEntry,
+        key: str,
+    ) -> None:
+        self._aggregate = aggregate
+        self._key = key
+        self._attr_name, is_temperature, self._value_fn = FLEET_SENSORS[key]
+
+        if is_temperature:
+            self._attr_device_class = SensorDeviceClass.TEMPERATURE
+            self._attr_native_unit_of_measurement = aggregates.temperature_unit
+            self._attr_suggested_display_precision = 1
+        else:
+            self._attr_native_unit_of_measurement = "thermostats"
+
+        # Aggregates get a device of their own, one per entry and per group
+        if aggregate.name is None:
+            self._fleet_id = f"{entry.entry_id}_fleet"
+            self._fleet_name = entry.title
+        else:
+            self._fleet_id = f"{entry.entry_id}_group_{slugify(aggregate.name)}"
+            self._fleet_name = aggregate.name
+
+    async def async_added_to_hass(self) -> None:
+        self.async_on_remove(self._aggregate.add_listener(self.async_write_ha_state))
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._fleet_id}_{self._key}"
+
+    @property
+    def device_info(self) -> dict[str, Any]:
+        return {
+            "identifiers": {(DOMAIN, self._fleet_id)},
+            "name": self._fleet_name,
+            "manufacturer": MANUFACTURER,
+            "model": "Thermostat group",
+        }
+
+    @property
+    def native_value(self) -> float | int | None:
+        return self._value_fn(self._aggregate)
+
+
+class NoLongerEvilFieldSensor(SensorEntity):
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+
+    def __init__(
+        self,
+        mqtt_client: Any,
+        device: dict[str, Any],
+        object_type: str,
+        field: str,
+        value: Any = None,
+    ) -> None:
+        self._mqtt_client = mqtt_client
+        self._path = f"{object_type}/{field}"
+
+        # Device info
+        self._serial = device[CONF_DEVICE_SERIAL]
+        self._device_name = device[CONF_DEVICE_NAME]
+
+        if description := FIELD_SENSORS.get(self._path):
+            self.entity_description = description
+            if description.device_class == SensorDeviceClass.TEMPERATURE:
+                temp_unit = device.get(CONF_TEMPERATURE_UNIT, DEFAULT_TEMPERATURE_UNIT)
+                self._attr_native_unit_of_measurement = (
+                    UnitOfTemperature.FAHRENHEIT
+                    if temp_unit.lower() == "fahrenheit"
+                    else UnitOfTemperature.CELSIUS
+                )
+        else:
+            self.entity_description = SensorEntityDescription(
+                key=self._path,
+                name=field.replace("_", " ").capitalize(),
+                entity_category=EntityCategory.DIAGNOSTIC,
+                entity_registry_enabled_default=False,
+            )
+
+        self._topic = mqtt_client.get_topic(self._serial, object_type, field)
+        self._value: str | float | None = None
+        if value is not None:
+            # A bad first value must not fail the whole discovery batch
+            try:
+                self._set_value(value)
+            except (ValueError, TypeError) as err:
+                _LOGGER.error("Failed to parse %s: %s", self._path, err)
+
+    def _set_value(self, value: Any) -> None:
+        description = self.entity_description
+        if description.device_class == SensorDeviceClass.ENUM:
+            if isinstance(value, str):
+                value = value.lower() in ("true", "1", "on")
+            self._value = "on" if value else "off"
+        elif description.native_unit_of_measurement is not None:
+            self._value = float(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            self._value = value
+        else:
+            self._value = str(value)
+
+    def _handle_value(self, topic: str, value: Any) -> None:
+        try:
+            self._set_value(value)
+        except (ValueError, TypeError) as err:
+            _LOGGER.error("Failed to parse %s: %s", self._path, err)
+            return
+
+        self._mqtt_client.schedule_update(self)
+
+    async def async_added_to_hass(self) -> None:
+        self.async_on_remove(
+            self._mqtt_client.subscribe(self._topic, self._handle_value)
+        )
+        self.async_on_remove(
+            self._mqtt_client.add_availability_listener(
+                self._serial, self.schedule_update_ha_state
+            )
+        )
+
+    @property
+    def unique_id(self) -> str:
+        return f"{self._serial}_field_{self._path}"
+
+    @property
+    def device_info(self) -> dict[str, Any]:
+        return {
+            "identifiers": {(DOMAIN, self._serial)},
+            "name": self._device_name,
+            "manufacturer": MANUFACTURER,
+            "model": MODEL,
+            "serial_number": self._serial,
+        }
+
+    @property
+    def available(self) -> bool:
+        return self._mqtt_client.is_available(self._serial)
+
+    @property
+    def native_value(self) -> str | float | None:
+        return self._value
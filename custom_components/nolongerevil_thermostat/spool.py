@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 1
+
+
+def _storage_key(entry_id: str) -> str:
+    return f"{DOMAIN}.{entry_id}.spool"
+
+
+# Persistent store for `*/set` commands that could not be published. Commands
+# are keyed by topic relative to the prefix ({serial}/{object_type}/{field}),
+# so a newer command for the same field replaces the older one and only the
+# last value is sent once the broker is back. Timestamps are wall clock so
+# TTLs keep counting across restarts.
+class CommandSpool:
+    def __init__(self, hass: HomeAssistant, entry_id: str) -> None:
+        self.hass = hass
+        self._store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, _storage_key(entry_id)
+        )
+        self._lock = threading.Lock()
+        self._commands: dict[str, dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    async def async_load(self) -> None:
+        data = await self._store.async_load()
+        if not data:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._commands = {
+                path: command
+                for path, command in data.get("commands", {}).items()
+                if command["expires"] > now
+            }
+        if self._commands:
+            _LOGGER.info("Loaded %s spooled command(s)", len(self._commands))
+
+    def add(self, path: str, payload: str | int | float | bool, ttl: float) -> None:
+        with self._lock:
+            self._commands[path] = {"payload": payload, "expires": time.time() + ttl}
+        self._schedule_save()
+
+    def discard(self, path: str) -> None:
+        # Fast path, the spool is empty unless the broker was unreachable
+        if path not in self._commands:
+            return
+        with self._lock:
+            self._commands.pop(path, None)
+        self._schedule_save()
+
+    def pop_pending(self) -> list[tuple[str, str | int | float | bool]]:
+        if not self._commands:
+            return []
+
+        now = time.time()
+        with self._lock:
+            pending = [
+                (path, command["payload"])
+                for path, command in self._commands.items()
+                if command["expires"] > now
+            ]
+            expired = len(self._commands) - len(pending)
+            self._commands = {}
+        self._schedule_save()
+
+        if expired:
+            _LOGGER.info("Dropped %s expired spooled command(s)", expired)
+        return pending
+
+    def _schedule_save(self) -> None:
+        # May be called from the paho thread or an executor job
+        self.hass.loop.call_soon_threadsafe(self._async_schedule_save)
+
+    @callback
+    def _async_schedule_save(self) -> None:
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> dict[str, Any]:
+        with self._lock:
+            return {"commands": dict(self._commands)}
+
+
+async def async_remove_spool(hass: HomeAssistant, entry_id: str) -> None:
+    await Store(hass, STORAGE_VERSION, _storage_key(entry_id)).async_remove()
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+import time
+from typing import Any
+
+
+# Wall clock time spent in each phase of setting up a config entry, kept for
+# the diagnostics so a slow start can be narrowed down without a profiler.
+class SetupTimer:
+    def __init__(self) -> None:
+        self._start = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.total: float | None = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def finish(self) -> None:
+        self.total = time.perf_counter() - self._start
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "total_ms": None if self.total is None else round(self.total * 1000, 1),
+            "phases_ms": {
+                name: round(seconds * 1000, 1) for name, seconds in self.phases.items()
+            },
+        }
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+import ssl
+import time
+from typing import Any
+
+from .const import (
+    CONF_TLS_CA_CERT,
+    CONF_TLS_CLIENT_CERT,
+    CONF_TLS_CLIENT_KEY,
+    CONF_TLS_VERIFY,
+    DEFAULT_TLS_VERIFY,
+    TLS_VERIFY_INSECURE,
+    TLS_VERIFY_NO_HOSTNAME,
+)
+
+
+class _TimedSSLSocket(ssl.SSLSocket):
+    def do_handshake(self, block: bool = False) -> None:
+        start = time.perf_counter()
+        super().do_handshake(block)
+        self.context.record_handshake(time.perf_counter() - start, self.session_reused)
+
+
+# SSL context that offers the session from the previous connection on every
+# new socket, so reconnects can use an abbreviated handshake. Paho only wraps
+# sockets through the context, which makes it the one place to hook this in.
+class ResumingSSLContext(ssl.SSLContext):
+    sslsocket_class = _TimedSSLSocket
+
+    def __new__(cls, protocol: int = ssl.PROTOCOL_TLS_CLIENT) -> ResumingSSLContext:
+        return super().__new__(cls, protocol)
+
+    def __init__(self, protocol: int = ssl.PROTOCOL_TLS_CLIENT) -> None:
+        # The protocol is consumed by SSLContext.__new__
+        super().__init__()
+        self.session: ssl.SSLSession | None = None
+        self.handshakes = 0
+        self.resumed_handshakes = 0
+        self.last_handshake_ms: float | None = None
+        self.last_session_reused = False
+
+    def wrap_socket(self, sock: Any, *args: Any, **kwargs: Any) -> ssl.SSLSocket:
+        if self.session is not None and kwargs.get("session") is None:
+            kwargs["session"] = self.session
+        return super().wrap_socket(sock, *args, **kwargs)
+
+    def record_handshake(self, duration: float, reused: bool) -> None:
+        self.handshakes += 1
+        self.resumed_handshakes += reused
+        self.last_handshake_ms = round(duration * 1000, 3)
+        self.last_session_reused = reused
+
+    def remember_session(self, sock: Any) -> None:
+        # TLS 1.3 tickets arrive after the handshake, so this is called once
+        # the broker has acknowledged the MQTT connection
+        if isinstance(sock, ssl.SSLSocket) and sock.session is not None:
+            self.session = sock.session
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "handshakes": self.handshakes,
+            "resumed_handshakes": self.resumed_handshakes,
+            "last_handshake_ms": self.last_handshake_ms,
+            "last_session_reused": self.last_session_reused,
+        }
+
+
+def create_ssl_context(config: Mapping[str, Any]) -> ResumingSSLContext:
+    # Loads certificates from disk, call from an executor job
+    context = ResumingSSLContext()
+
+    verify = config.get(CONF_TLS_VERIFY, DEFAULT_TLS_VERIFY)
+    if verify == TLS_VERIFY_INSECURE:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    else:
+        if verify == TLS_VERIFY_NO_HOSTNAME:
+            context.check_hostname = False
+        if ca_cert := config.get(CONF_TLS_CA_CERT):
+            context.load_verify_locations(cafile=ca_cert)
+        else:
+            context.load_default_certs()
+
+    if client_cert := config.get(CONF_TLS_CLIENT_CERT):
+        context.load_cert_chain(client_cert, config.get(CONF_TLS_CLIENT_KEY) or None)
+
+    return context
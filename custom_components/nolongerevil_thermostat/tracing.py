@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+_LOGGER = logging.getLogger(__name__)
+
+
+# Per-serial, sampled trace logging for the MQTT message path. While tracing
+# is off, `active` is the only thing checked per message. The sampling decision
+# is made once per message in `begin`; handlers consult `sampled` before
+# formatting anything.
+class MessageTracer:
+    def __init__(self) -> None:
+        self.active = False
+        self.sampled = False
+        self._all_rate = 0
+        self._rates: dict[str, int] = {}
+        self._counters: dict[str, int] = {}
+
+    def enable(self, serial: str | None, sample_rate: int = 1) -> None:
+        if serial is None:
+            self._all_rate = sample_rate
+        else:
+            self._rates[serial.upper()] = sample_rate
+        self.active = True
+
+    def disable(self, serial: str | None = None) -> None:
+        if serial is None:
+            self._all_rate = 0
+            self._rates.clear()
+            self._counters.clear()
+        else:
+            self._rates.pop(serial.upper(), None)
+            self._counters.pop(serial.upper(), None)
+        self.active = bool(self._all_rate or self._rates)
+
+    def begin(self, serial: str) -> bool:
+        rate = self._rates.get(serial, self._all_rate)
+        if not rate:
+            self.sampled = False
+            return False
+
+        # Trace one message out of every `rate` for this serial
+        count = self._counters.get(serial, 0)
+        self._counters[serial] = count + 1
+        self.sampled = count % rate == 0
+        return self.sampled
+
+    def end(self) -> None:
+        self.sampled = False
+
+    def log(self, msg: str, *args: Any) -> None:
+        _LOGGER.info(msg, *args)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "active": self.active,
+            "all_devices_sample_rate": self._all_rate,
+            "sample_rates": dict(self._rates),
+        }
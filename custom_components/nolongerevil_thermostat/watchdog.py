@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+from datetime import datetime
+import heapq
+import logging
+import time
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+_LOGGER = logging.getLogger(__name__)
+
+# Minimum delay between two timer runs, due devices are expired together
+WATCHDOG_RESOLUTION = 1.0
+
+
+# Marks devices stale when they stop publishing. A single heap of deadlines,
+# one entry per fresh device, is driven by a single HA timer armed for the
+# earliest deadline. Messages only record a timestamp; the heap is touched
+# once per device per timeout period, when its deadline comes up.
+class StaleWatchdog:
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        timeout: float,
+        on_change: Callable[[str, bool], None],
+    ) -> None:
+        self.hass = hass
+        self.timeout = timeout
+        self._on_change = on_change
+        self._serials: list[str] = []
+        self._last_seen: dict[str, float] = {}
+        self._stale: set[str] = set()
+        self._heap: list[tuple[float, str]] = []
+        self._unsub_timer: CALLBACK_TYPE | None = None
+        self._next_run: float | None = None
+
+    def seen(self, serial: str) -> None:
+        # Called from the paho thread for every message
+        self._last_seen[serial] = time.monotonic()
+        if serial in self._stale:
+            self.hass.loop.call_soon_threadsafe(self._async_refresh, serial)
+
+    def is_stale(self, serial: str) -> bool:
+        return serial in self._stale
+
+    def last_seen(self, serial: str) -> float | None:
+        # time.monotonic() of the last message, only tracked with a timeout
+        return self._last_seen.get(serial)
+
+    @property
+    def stale_serials(self) -> list[str]:
+        return sorted(self._stale)
+
+    @callback
+    def async_start(self, serials: Iterable[str]) -> None:
+        self._serials = list(serials)
+        if not self.timeout:
+            return
+
+        # Give every device a full timeout after startup before judging it
+        now = time.monotonic()
+        for serial in self._serials:
+            self._last_seen.setdefault(serial, now)
+            self._heap.append((self._last_seen[serial] + self.timeout, serial))
+        heapq.heapify(self._heap)
+        self._async_schedule()
+
+    @callback
+    def async_stop(self) -> None:
+        if self._unsub_timer:
+            self._unsub_timer()
+            self._unsub_timer = None
+        self._next_run = None
+        self._heap.clear()
+
+    @callback
+    def async_set_timeout(self, timeout: float) -> None:
+        if timeout == self.timeout:
+            return
+
+        self.async_stop()
+        # Nothing was recorded while the watchdog was off, so old timestamps
+        # would put every deadline in the past; start with a fresh grace period
+        if not self.timeout:
+            self._last_seen.clear()
+        self.timeout = timeout
+
+        # Devices are re-judged against the new timeout
+        stale = self._stale
+        self._stale = set()
+        for serial in stale:
+            self._on_change(serial, True)
+        self.async_start(self._serials)
+
+    @callback
+    def _async_schedule(self) -> None:
+        if not self._heap:
+            return
+
+        run_at = max(self._heap[0][0], time.monotonic() + WATCHDOG_RESOLUTION)
+        if self._next_run is not None and self._next_run <= run_at:
+            return
+
+        if self._unsub_timer:
+            self._unsub_timer()
+        self._next_run = run_at
+        self._unsub_timer = async_call_later(
+            self.hass, run_at - time.monotonic(), self._async_expire
+        )
+
+    @callback
+    def _async_expire(self, _now: datetime) -> None:
+        self._unsub_timer = None
+        self._next_run = None
+
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            _, serial = heapq.heappop(self._heap)
+            deadline = self._last_seen[serial] + self.timeout
+            if deadline > now:
+                # Heard from since the entry was pushed, re-arm it
+                heapq.heappush(self._heap, (deadline, serial))
+                continue
+
+            _LOGGER.warning(
+                "No message from %s for %s seconds, marking unavailable",
+                serial,
+                self.timeout,
+            )
+            self._stale.add(serial)
+            self._on_change(serial, False)
+
+        self._async_schedule()
+
+    @callback
+    def _async_refresh(self, serial: str) -> None:
+        if serial not in self._stale:
+            return
+
+        _LOGGER.info("Received message from %s, marking available", serial)
+        self._stale.discard(serial)
+        if self.timeout:
+            heapq.heappush(self._heap, (self._last_seen[serial] + self.timeout, serial))
+            self._async_schedule()
+        self._on_change(serial, True)
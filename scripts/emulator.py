@@ -0,0 +1,400 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+import itertools
+import json
+import queue
+import random
+import threading
+import time
+from typing import Any
+
+import cbor2
+import msgpack
+
+# In-process stand-in for an MQTT broker and a fleet of thermostats running
+# No Longer Evil firmware, following the {prefix}/{serial}/{object_type}/{field}
+# layout from const.py. The client mimics the subset of paho.mqtt.client.Client
+# used by the integration, so it can be swapped in for paho without a network.
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+
+
+@dataclass
+class EmulatedMessage:
+    topic: str
+    payload: bytes
+    retain: bool = False
+    qos: int = 0
+
+
+@dataclass
+class EmulatedPublishResult:
+    rc: int
+    mid: int
+
+
+def _static_prefix(topic_filter: str) -> str:
+    levels = topic_filter.split("/")
+    for depth, level in enumerate(levels):
+        if level in ("+", "#"):
+            return "/".join(levels[:depth])
+    return topic_filter
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level not in ("+", topic_levels[index]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class LocalBroker:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._exact: dict[str, set[EmulatedClient]] = defaultdict(set)
+        # Wildcard filters indexed by their levels before the first wildcard,
+        # so a publish only looks at filters that can match its topic
+        self._wildcards: dict[str, dict[str, set[EmulatedClient]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+        self._retained: dict[str, EmulatedMessage] = {}
+        # Retained topics indexed by each of their parent levels, so a wildcard
+        # subscription only looks at topics below its static prefix
+        self._retained_below: dict[str, set[str]] = defaultdict(set)
+        self._mid = itertools.count(1)
+        self.delivered = 0
+        self.delivered_bytes = 0
+        self.clients: list[EmulatedClient] = []
+
+    def create_client(self, *args: Any, **kwargs: Any) -> EmulatedClient:
+        # Drop-in for paho.mqtt.client.Client
+        client = EmulatedClient(self, kwargs.get("client_id", ""))
+        self.clients.append(client)
+        return client
+
+    @property
+    def pending(self) -> int:
+        # Messages delivered to clients but not yet taken by their loops
+        return sum(client.pending for client in self.clients)
+
+    def next_mid(self) -> int:
+        return next(self._mid)
+
+    def subscribe(self, client: EmulatedClient, topic_filter: str) -> None:
+        with self._lock:
+            if "+" in topic_filter or "#" in topic_filter:
+                self._wildcards[_static_prefix(topic_filter)][topic_filter].add(client)
+                retained = [
+                    self._retained[topic]
+                    for topic in self._retained_below.get(
+                        _static_prefix(topic_filter), ()
+                    )
+                    if topic_matches(topic_filter, topic)
+                ]
+            else:
+                self._exact[topic_filter].add(client)
+                retained = []
+                if topic_filter in self._retained:
+                    retained.append(self._retained[topic_filter])
+
+        for message in retained:
+            client.deliver(message)
+
+    def disconnect(self, client: EmulatedClient) -> None:
+        with self._lock:
+            for subscribers in self._exact.values():
+                subscribers.discard(client)
+            for filters in self._wildcards.values():
+                for subscribers in filters.values():
+                    subscribers.discard(client)
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        message = EmulatedMessage(topic, payload, retain)
+        with self._lock:
+            levels = topic.split("/")
+            if retain:
+                if topic not in self._retained:
+                    for depth in range(len(levels)):
+                        self._retained_below["/".join(levels[:depth])].add(topic)
+                self._retained[topic] = message
+            subscribers = set(self._exact.get(topic, ()))
+            for depth in range(len(levels)):
+                filters = self._wildcards.get("/".join(levels[:depth]))
+                if not filters:
+                    continue
+                for topic_filter, clients in filters.items():
+                    if clients and topic_matches(topic_filter, topic):
+                        subscribers |= clients
+            self.delivered += len(subscribers)
+            self.delivered_bytes += len(subscribers) * len(payload)
+
+        for client in subscribers:
+            client.deliver(message)
+
+
+class EmulatedClient:
+    def __init__(self, broker: LocalBroker, client_id: str = "") -> None:
+        self.broker = broker
+        self.client_id = client_id
+        self.on_connect: Callable | None = None
+        self.on_message: Callable | None = None
+        self.on_disconnect: Callable | None = None
+        self._connected = False
+        # Like paho, is_connected() only turns true once the network thread
+        # has handled the connection
+        self._acknowledged = False
+        self._queue: queue.SimpleQueue[EmulatedMessage | None] = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    # paho.mqtt.client.Client API subset
+    def username_pw_set(self, username: str, password: str | None = None) -> None:
+        pass
+
+    def tls_set_context(self, context: Any = None) -> None:
+        pass
+
+    def tls_insecure_set(self, value: bool) -> None:
+        pass
+
+    def connect(self, host: str, port: int = 1883, keepalive: int = 60) -> int:
+        self._connected = True
+        return MQTT_ERR_SUCCESS
+
+    def disconnect(self) -> int:
+        self._connected = False
+        self._acknowledged = False
+        self.broker.disconnect(self)
+        if self.on_disconnect:
+            self.on_disconnect(self, None, 0)
+        return MQTT_ERR_SUCCESS
+
+    def is_connected(self) -> bool:
+        return self._acknowledged
+
+    def socket(self) -> None:
+        return None
+
+    def loop_start(self) -> int:
+        # Like paho, callbacks run on a dedicated network thread
+        self._thread = threading.Thread(
+            target=self._loop, name=f"emulated-mqtt-{self.client_id}", daemon=True
+        )
+        self._thread.start()
+        return MQTT_ERR_SUCCESS
+
+    def loop_stop(self) -> int:
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        return MQTT_ERR_SUCCESS
+
+    def subscribe(self, topic: str, qos: int = 0) -> tuple[int, int]:
+        if not self._connected:
+            return MQTT_ERR_NO_CONN, 0
+        self.broker.subscribe(self, topic)
+        return MQTT_ERR_SUCCESS, self.broker.next_mid()
+
+    def publish(
+        self,
+        topic: str,
+        payload: str | bytes | None = None,
+        qos: int = 0,
+        retain: bool = False,
+    ) -> EmulatedPublishResult:
+        if not self._connected:
+            return EmulatedPublishResult(MQTT_ERR_NO_CONN, 0)
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        self.broker.publish(topic, payload or b"", retain)
+        return EmulatedPublishResult(MQTT_ERR_SUCCESS, self.broker.next_mid())
+
+    # Emulator internals
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def deliver(self, message: EmulatedMessage) -> None:
+        self._queue.put(message)
+
+    def _loop(self) -> None:
+        self._acknowledged = self._connected
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+
+        while (message := self._queue.get()) is not None:
+            if self.on_message:
+                self.on_message(self, None, message)
+
+
+def default_state(index: int) -> dict[str, Any]:
+    return {
+        "device/current_temperature": round(19.0 + (index % 40) / 10, 1),
+        "device/fan_timer_active": False,
+        "device/away": False,
+        "device/current_humidity": 40 + index % 20,
+        "device/battery_level": 3.9,
+        "device/current_version": "5.9.4-6",
+        "shared/target_temperature": 21.0,
+        "shared/target_temperature_low": 19.0,
+        "shared/target_temperature_high": 24.0,
+        "shared/target_temperature_type": "heat",
+        "shared/hvac_heater_state": False,
+    }
+
+
+class ThermostatFleet:
+    def __init__(
+        self,
+        broker: LocalBroker,
+        count: int,
+        prefix: str = "nest",
+        report_interval: float = 0.0,
+        serial_format: str = "EMU{:013d}",
+        state_topic: bool = False,
+        encoding: str = "text",
+    ) -> None:
+        self.broker = broker
+        self.prefix = prefix
+        self.report_interval = report_interval
+        # Publish one JSON document per update on {prefix}/{serial}/state
+        # instead of one message per field
+        self.state_topic = state_topic
+        # "text", "msgpack" or "cbor", like the integration's payload_encoding
+        self.encoding = encoding
+        self.serials = [serial_format.format(index) for index in range(count)]
+        self.state = {
+            serial: default_state(index) for index, serial in enumerate(self.serials)
+        }
+        self.commands = 0
+        self._client = broker.create_client(client_id="emulated-fleet")
+        self._client.on_connect = self._on_connect
+        self._client.on_message = self._on_message
+        self._stop = threading.Event()
+        self._reporter: threading.Thread | None = None
+
+    def devices(self) -> list[dict[str, str]]:
+        return [
+            {
+                "name": f"Emulated {serial}",
+                "serial": serial,
+                "temperature_unit": "celsius",
+            }
+            for serial in self.serials
+        ]
+
+    def start(self) -> None:
+        self._client.connect("localhost")
+        self._client.loop_start()
+        for serial in self.serials:
+            self.publish_state(serial)
+            self.broker.publish(
+                f"{self.prefix}/{serial}/availability", b"online", retain=True
+            )
+
+        if self.report_interval:
+            self._reporter = threading.Thread(
+                target=self._report, name="emulated-fleet-reporter", daemon=True
+            )
+            self._reporter.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._reporter:
+            self._reporter.join()
+        self._client.loop_stop()
+        self._client.disconnect()
+
+    def publish_state(self, serial: str, fields: Iterable[str] | None = None) -> None:
+        state = self.state[serial]
+        if self.state_topic:
+            document: dict[str, dict[str, Any]] = {}
+            for key, value in state.items():
+                object_type, field = key.split("/")
+                document.setdefault(object_type, {})[field] = value
+            self.broker.publish(
+                f"{self.prefix}/{serial}/state",
+                _encode(document, self.encoding),
+                retain=True,
+            )
+            return
+
+        for field in fields or state:
+            self.broker.publish(
+                f"{self.prefix}/{serial}/{field}",
+                _encode(state[field], self.encoding),
+                retain=True,
+            )
+
+    def _on_connect(self, client: EmulatedClient, userdata: Any, flags, rc) -> None:
+        client.subscribe(f"{self.prefix}/+/+/+/set")
+
+    def _on_message(
+        self, client: EmulatedClient, userdata: Any, msg: EmulatedMessage
+    ) -> None:
+        # {prefix}/{serial}/{object_type}/{field}/set
+        serial, object_type, field = msg.topic[len(self.prefix) + 1 :].split("/")[:3]
+        state = self.state.get(serial)
+        key = f"{object_type}/{field}"
+        if state is None or key not in state:
+            return
+
+        self.commands += 1
+        state[key] = _decode(msg.payload, state[key], self.encoding)
+        # The firmware echoes accepted commands on the retained state topic
+        self.publish_state(serial, (key,))
+
+    def _report(self) -> None:
+        # Each device reports a drifting temperature every report_interval,
+        # spread evenly across the interval
+        serials = itertools.cycle(self.serials)
+        delay = self.report_interval / len(self.serials)
+        next_at = time.monotonic()
+        while not self._stop.is_set():
+            serial = next(serials)
+            state = self.state[serial]
+            state["device/current_temperature"] = round(
+                state["device/current_temperature"] + random.uniform(-0.2, 0.2), 1
+            )
+            self.publish_state(serial, ("device/current_temperature",))
+
+            next_at += delay
+            if (sleep := next_at - time.monotonic()) > 0:
+                self._stop.wait(sleep)
+
+
+def _encode(value: Any, encoding: str = "text") -> bytes:
+    if encoding == "msgpack":
+        return msgpack.packb(value)
+    if encoding == "cbor":
+        return cbor2.dumps(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value).encode("utf-8")
+    if isinstance(value, bool):
+        return b"true" if value else b"false"
+    return str(value).encode("utf-8")
+
+
+def _decode(payload: bytes, current: Any, encoding: str = "text") -> Any:
+    if encoding == "msgpack":
+        return msgpack.unpackb(payload)
+    if encoding == "cbor":
+        return cbor2.loads(payload)
+    text = payload.decode("utf-8")
+    if text.startswith(("{", "[")):
+        return json.loads(text)
+    if isinstance(current, bool):
+        return text.lower() in ("true", "1", "on")
+    if isinstance(current, float):
+        return float(text)
+    return text
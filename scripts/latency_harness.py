@@ -0,0 +1,347 @@
+from __future__ import annotations
+
+# End-to-end latency harness: boots Home Assistant in-process with the
+# integration loaded from this repository, swaps paho for the emulator in
+# emulator.py, and measures the time from a climate.set_temperature service
+# call until the thermostat's echo shows up in the entity state.
+#
+#   python scripts/latency_harness.py --devices 1000 --report-interval 30
+#
+# Exits non-zero if the p95 latency exceeds --max-p95-ms, the config entry
+# setup takes longer than --max-setup-s, or an echo times out.
+
+import argparse
+import asyncio
+from contextlib import ExitStack
+import importlib
+import logging
+import os
+from pathlib import Path
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any
+from unittest.mock import patch
+
+from homeassistant import bootstrap, loader
+from homeassistant.config_entries import ConfigEntries
+from homeassistant.const import ATTR_TEMPERATURE, EVENT_STATE_CHANGED
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers import entity_registry as er
+import paho.mqtt.client as mqtt
+
+from emulator import LocalBroker, ThermostatFleet
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DOMAIN = "nolongerevil_thermostat"
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Measure set_temperature to state echo latency against "
+        "emulated thermostats."
+    )
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=30.0,
+        help="seconds between temperature reports per device, 0 to disable",
+    )
+    parser.add_argument("--commands", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument(
+        "--max-setup-s",
+        type=float,
+        default=None,
+        help="budget for setting up the config entry, excluding the config flow",
+    )
+    parser.add_argument(
+        "--state-topic",
+        action="store_true",
+        help="publish one JSON state document per update instead of per-field topics",
+    )
+    parser.add_argument(
+        "--extra-sensors",
+        action="store_true",
+        help="subscribe to every field and create sensors for unmapped ones",
+    )
+    parser.add_argument(
+        "--encoding", choices=("text", "msgpack", "cbor"), default="text"
+    )
+    return parser.parse_args(argv)
+
+
+async def async_start_hass(config_dir: str) -> HomeAssistant:
+    # Make custom_components/ from this repository importable the same way
+    # Home Assistant loads it from a config directory
+    os.symlink(REPO_ROOT / "custom_components", Path(config_dir, "custom_components"))
+    sys.path.insert(0, config_dir)
+
+    hass = HomeAssistant(config_dir)
+    hass.config.skip_pip = True
+    loader.async_setup(hass)
+    hass.config_entries = ConfigEntries(hass, {})
+    await bootstrap.async_load_base_functionality(hass)
+
+    # The integration talks to the broker through its own paho client; the
+    # mqtt manifest dependency would pull in http and friends for nothing
+    hass.config.components.add("mqtt")
+    return hass
+
+
+async def async_add_entry(
+    hass: HomeAssistant, fleet: ThermostatFleet, extra_sensors: bool = False
+) -> dict[str, Any]:
+    # Go through the config flow like a user would, one device per step
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": "user"}
+    )
+    result = await hass.config_entries.flow.async_configure(
+        result["flow_id"],
+        {
+            "mqtt_broker": "localhost",
+            "mqtt_port": 1883,
+            "topic_prefix": fleet.prefix,
+            "state_topic": fleet.state_topic,
+            "payload_encoding": fleet.encoding,
+            "extra_sensors": extra_sensors,
+        },
+    )
+    devices = fleet.devices()
+    for index, device in enumerate(devices):
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], {**device, "add_another": index < len(devices) - 1}
+        )
+    await hass.async_block_till_done()
+
+    # Setup timings as shown in the diagnostics download
+    diagnostics = importlib.import_module(f"custom_components.{DOMAIN}.diagnostics")
+    data = await diagnostics.async_get_config_entry_diagnostics(
+        hass, hass.config_entries.async_get_entry(result["result"].entry_id)
+    )
+    return data["setup"]
+
+
+async def async_measure(
+    hass: HomeAssistant, fleet: ThermostatFleet, args: argparse.Namespace
+) -> tuple[list[float], int]:
+    registry = er.async_get(hass)
+    entity_ids = [
+        registry.async_get_entity_id("climate", DOMAIN, f"{serial}_climate")
+        for serial in fleet.serials
+    ]
+
+    waiters: dict[str, tuple[float, asyncio.Future[float]]] = {}
+
+    @callback
+    def async_state_changed(event: Event) -> None:
+        waiter = waiters.get(event.data["entity_id"])
+        new_state = event.data["new_state"]
+        if (
+            waiter
+            and new_state is not None
+            and new_state.attributes.get(ATTR_TEMPERATURE) == waiter[0]
+            and not waiter[1].done()
+        ):
+            waiter[1].set_result(time.perf_counter())
+
+    hass.bus.async_listen(EVENT_STATE_CHANGED, async_state_changed)
+
+    latencies: list[float] = []
+    timeouts = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def async_command(index: int) -> None:
+        nonlocal timeouts
+        entity_id = entity_ids[index % len(entity_ids)]
+        async with semaphore:
+            # Always move the setpoint, an unchanged value would not be echoed
+            # as a state change
+            current = hass.states.get(entity_id).attributes.get(ATTR_TEMPERATURE)
+            target = 16.0 if current is None or current >= 26.0 else current + 0.5
+            echoed: asyncio.Future[float] = hass.loop.create_future()
+            waiters[entity_id] = (target, echoed)
+            start = time.perf_counter()
+            await hass.services.async_call(
+                "climate",
+                "set_temperature",
+                {"entity_id": entity_id, ATTR_TEMPERATURE: target},
+                blocking=True,
+            )
+            try:
+                end = await asyncio.wait_for(echoed, args.timeout)
+            except TimeoutError:
+                timeouts += 1
+            else:
+                latencies.append((end - start) * 1000)
+            finally:
+                waiters.pop(entity_id, None)
+
+    # Commands for the same entity never overlap, so each echo is unambiguous
+    for batch_start in range(0, args.commands, len(entity_ids)):
+        batch = range(batch_start, min(batch_start + len(entity_ids), args.commands))
+        await asyncio.gather(*(async_command(index) for index in batch))
+
+    return latencies, timeouts
+
+
+async def async_wait_for_state(hass: HomeAssistant, broker: LocalBroker) -> None:
+    # The retained state is delivered once the entities exist; wait until
+    # every thermostat has reported and the burst has been handled, so it
+    # does not skew the latencies
+    while broker.pending or any(
+        state.attributes.get("current_temperature") is None
+        for state in hass.states.async_all("climate")
+    ):
+        await asyncio.sleep(0.1)
+    await hass.async_block_till_done()
+
+
+async def async_wait_for_discovery(hass: HomeAssistant) -> int:
+    registry = er.async_get(hass)
+    count = -1
+    while True:
+        # Longer than the discovery batch delay, so a quiet period after the
+        # first sensors appeared means done
+        await asyncio.sleep(2)
+        await hass.async_block_till_done()
+        discovered = sum(
+            1 for entry in registry.entities.values() if "_field_" in entry.unique_id
+        )
+        if discovered and discovered == count:
+            return discovered
+        count = discovered
+
+
+def check_payloads() -> list[str]:
+    # Fields are decoded strictly in the configured encoding: integers from 32
+    # to 126 are a single printable byte in MessagePack, and words like "cool"
+    # are valid CBOR, so nothing may be guessed from the bytes. Availability
+    # is always plain text.
+    codec = importlib.import_module(f"custom_components.{DOMAIN}.codec")
+    errors = []
+    values = (0, 1, 40, 70, 126, 21.5, "0", "1", "cool", "heat", "off")
+    for encoding in ("text", "msgpack", "cbor"):
+        payload_codec = codec.PayloadCodec(encoding)
+        for value in values:
+            payload = payload_codec.encode(value)
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+                expected = str(value)
+            else:
+                expected = value
+            decoded = payload_codec.decode(payload)
+            if decoded != expected:
+                errors.append(f"{encoding} decodes {value!r} as {decoded!r}")
+    for payload in (b"online", b"offline", b"1"):
+        if codec.decode_text(payload) != payload.decode():
+            errors.append(f"availability {payload!r} is not read as text")
+    return errors
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def async_main(args: argparse.Namespace) -> int:
+    logging.basicConfig(level=logging.WARNING)
+    broker = LocalBroker()
+    fleet = ThermostatFleet(
+        broker,
+        args.devices,
+        report_interval=args.report_interval,
+        state_topic=args.state_topic,
+        encoding=args.encoding,
+    )
+
+    with tempfile.TemporaryDirectory() as config_dir, ExitStack() as stack:
+        stack.enter_context(patch.object(mqtt, "Client", broker.create_client))
+        fleet.start()
+        hass = await async_start_hass(config_dir)
+        if errors := check_payloads():
+            print("\n".join(errors))
+            await hass.async_stop()
+            fleet.stop()
+            return 1
+
+        start = time.perf_counter()
+        setup = await async_add_entry(hass, fleet, args.extra_sensors)
+        flow_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.wait_for(async_wait_for_state(hass, broker), args.timeout)
+        state_seconds = time.perf_counter() - start
+
+        # Let field discovery register its sensors before measuring
+        discovered = 0
+        start = time.perf_counter()
+        if args.extra_sensors:
+            try:
+                discovered = await asyncio.wait_for(
+                    async_wait_for_discovery(hass), args.timeout
+                )
+            except TimeoutError:
+                print(f"Field discovery did not settle within {args.timeout} s")
+                await hass.async_stop()
+                fleet.stop()
+                return 1
+        discovery_seconds = time.perf_counter() - start
+
+        delivered_before = broker.delivered
+        bytes_before = broker.delivered_bytes
+        start = time.perf_counter()
+        latencies, timeouts = await async_measure(hass, fleet, args)
+        elapsed = time.perf_counter() - start
+        delivered = broker.delivered - delivered_before
+        delivered_bytes = broker.delivered_bytes - bytes_before
+
+        for entry in hass.config_entries.async_entries(DOMAIN):
+            await hass.config_entries.async_unload(entry.entry_id)
+        await hass.async_stop()
+        fleet.stop()
+
+    report: dict[str, Any] = {
+        "devices": args.devices,
+        "mode": "state topic" if args.state_topic else "field topics",
+        "encoding": args.encoding,
+        "flow_s": round(flow_seconds, 3),
+        "setup_s": round(setup["total_ms"] / 1000, 3),
+        "setup_phases_ms": ", ".join(
+            f"{name} {ms}" for name, ms in setup["phases_ms"].items()
+        ),
+        "state_s": round(state_seconds, 3),
+        "discovered": discovered,
+        "discovery_s": round(discovery_seconds, 3),
+        "commands": len(latencies),
+        "timeouts": timeouts,
+        "messages_per_s": round(delivered / elapsed, 1),
+        "bytes_per_message": round(delivered_bytes / max(delivered, 1), 1),
+    }
+    if latencies:
+        report |= {
+            "p50_ms": round(statistics.median(latencies), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "max_ms": round(max(latencies), 3),
+        }
+    for key, value in report.items():
+        print(f"{key:>17}: {value}")
+
+    if timeouts or not latencies:
+        return 1
+    if args.max_p95_ms is not None and report["p95_ms"] > args.max_p95_ms:
+        print(f"p95 latency above budget of {args.max_p95_ms} ms")
+        return 1
+    if args.max_setup_s is not None and report["setup_s"] > args.max_setup_s:
+        print(f"Setup above budget of {args.max_setup_s} s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(async_main(parse_args())))